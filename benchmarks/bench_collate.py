@@ -0,0 +1,85 @@
+"""Benchmark of tidings.utils.collate()
+
+Merges dozens of large, sorted streams of fake recipients, as an EventUnion
+of many events would, with the heap-based collate() and with the
+list-scanning one it replaced. Run from the top of the checkout::
+
+    python benchmarks/bench_collate.py [streams] [items per stream]
+
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.mockapp.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from tidings.compat import range  # noqa: E402
+from tidings.utils import collate  # noqa: E402
+
+
+def list_collate(*iterables, **kwargs):
+    """The collate() that scanned and edited a list for every item"""
+    key = kwargs.pop('key', lambda a: a)
+    reverse = kwargs.pop('reverse', False)
+    min_or_max = max if reverse else min
+
+    rows = [iter(iterable) for iterable in iterables if iterable]
+    next_values = {}
+    by_key = []
+
+    def gather_next_value(row, index):
+        try:
+            next_value = next(row)
+        except StopIteration:
+            pass
+        else:
+            next_values[index] = next_value
+            by_key.append((key(next_value), index))
+
+    for index, row in enumerate(rows):
+        gather_next_value(row, index)
+
+    while by_key:
+        key_value, index = min_or_max(by_key)
+        by_key.remove((key_value, index))
+        next_value = next_values.pop(index)
+        yield next_value
+        gather_next_value(rows[index], index)
+
+
+def recipient_streams(count, length):
+    """Return ``count`` lists of (email, watch) pairs sorted descending by
+    email, like the output of _users_watching()."""
+    streams = []
+    for n in range(count):
+        emails = sorted(('user%07d@example.com' % random.randrange(10 ** 7)
+                         for x in range(length)), reverse=True)
+        streams.append([(email, n) for email in emails])
+    return streams
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    streams = recipient_streams(count, length)
+
+    def email_key(pair):
+        return pair[0].lower()
+
+    results = []
+    for name, merge in [('list', list_collate), ('heap', collate)]:
+        start = time.time()
+        results.append(list(merge(*streams, key=email_key, reverse=True)))
+        print('%-5s merged %d streams of %d in %.2fs' %
+              (name, count, length, time.time() - start))
+    assert results[0] == results[1], 'Merges disagree!'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Micro-benchmark of multi_raw()'s row-to-model hydration
+
+Compares the per-row kwargs path multi_raw() used to take with the
+positional ``Model.from_db()`` path over synthetic (User, Watch) rows. No
+database is touched. Run from the top of the checkout::
+
+    python benchmarks/bench_multi_raw.py [rows]
+
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.mockapp.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+
+from tidings.models import Watch, _row_hydrator  # noqa: E402
+
+
+def kwargs_hydrator(models, model_to_fields):
+    """The hydration multi_raw() did before it used from_db()"""
+    def hydrate(row):
+        row_iter = iter(row)
+        return [model_class(**dict((a, next(row_iter))
+                            for a in model_to_fields[model_class]))
+                for model_class in models]
+    return hydrate
+
+
+def synthetic_rows(count, models):
+    """Return ``count`` rows shaped like multi_raw()'s (User, Watch) rows."""
+    row = tuple(field.get_default() for model_class in models
+                for field in model_class._meta.fields)
+    return [row] * count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    User = get_user_model()
+    models = [User, Watch]
+    model_to_fields = dict((m, [f.get_attname() for f in m._meta.fields])
+                           for m in models)
+    rows = synthetic_rows(count, models)
+
+    for name, hydrate in [
+            ('kwargs', kwargs_hydrator(models, model_to_fields)),
+            ('from_db', _row_hydrator(models, model_to_fields, 'default'))]:
+        start = time.time()
+        for row in rows:
+            hydrate(row)
+        elapsed = time.time() - start
+        print('%-8s %d rows in %.2fs (%.0f rows/s)' %
+              (name, count, elapsed, count / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark of rendering mails serially and in a process pool
+
+Renders a deliberately heavy template for many recipients with
+emails_with_users_and_watches(), first in this process and then with
+``processes`` set. Run from the top of the checkout::
+
+    python benchmarks/bench_render.py [recipients] [processes] [chunk size]
+
+"""
+from multiprocessing import cpu_count
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.mockapp.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from tidings.compat import range  # noqa: E402
+from tidings.models import EmailUser, Watch  # noqa: E402
+from tidings.utils import emails_with_users_and_watches  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count()
+    chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    users_and_watches = [(EmailUser('user%s@example.com' % n), [Watch()])
+                         for n in range(count)]
+    # A few hundred loop iterations per mail stand in for a long thread or
+    # a big diff.
+    vars = {'post': 'Post! ' * 1000, 'tags': ['tag%s' % n for n in range(300)]}
+
+    for name, kwargs in [
+            ('serial', {'processes': 0}),
+            ('%s procs' % processes, {'processes': processes,
+                                      'chunk_size': chunk_size})]:
+        start = time.time()
+        mails = list(emails_with_users_and_watches(
+            'Subject', 'tests/email.txt', vars, users_and_watches, **kwargs))
+        print('%-9s rendered %d mails in %.2fs' %
+              (name, len(mails), time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+try:
+    from socketserver import StreamRequestHandler, ThreadingTCPServer
+except ImportError:  # Python 2
+    from SocketServer import StreamRequestHandler, ThreadingTCPServer
+import threading
+import time
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+
+from tidings.compat import range
+
+
+class SinkHandler(StreamRequestHandler):
+    """Just enough of an SMTP server to accept mail from smtplib"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            self.reply('220 sink')
+            recipients = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                verb = line[:4].upper()
+                if verb == b'RCPT':
+                    recipients.append(line.split(b':', 1)[1].strip(b' <>\r\n')
+                                      .decode('ascii'))
+                elif verb == b'DATA':
+                    self.reply('354 go ahead')
+                    while self.rfile.readline() not in (b'.\r\n', b''):
+                        pass
+                    # Pretend to be a relay some distance away:
+                    time.sleep(server.latency)
+                    with server.lock:
+                        server.received.extend(recipients)
+                    recipients = []
+                elif verb == b'QUIT':
+                    self.reply('221 bye')
+                    break
+                self.reply('250 ok')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class SMTPSink(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0):
+        ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), SinkHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = self.max_active = 0
+        self.received = []
+
+
+class SendConcurrentlyTests(TestCase):
+    """Tests for send_concurrently()"""
+
+    def _messages(self, count):
+        return (EmailMessage('Subject', 'Body', 'from@example.com',
+                             ['%s@example.com' % n])
+                for n in range(count))
+
+    def test_smtp(self):
+        """Deliver over several SMTP sessions at once to a local sink."""
+        from tidings.delivery import send_concurrently
+
+        sink = SMTPSink(latency=0.05)
+        thread = threading.Thread(target=sink.serve_forever)
+        thread.start()
+        try:
+            with override_settings(
+                    EMAIL_BACKEND='django.core.mail.backends.smtp.'
+                                  'EmailBackend',
+                    EMAIL_HOST='127.0.0.1',
+                    EMAIL_PORT=sink.server_address[1]):
+                results = send_concurrently(self._messages(12), 4)
+        finally:
+            sink.shutdown()
+            sink.server_close()
+            thread.join()
+
+        expected = sorted('%s@example.com' % n for n in range(12))
+        self.assertEqual(expected, sorted(sink.received))
+        self.assertEqual(expected, sorted(to[0] for to, error in results))
+        self.assertEqual([None] * 12, [error for to, error in results])
+        self.assertEqual(4, sink.max_active)
+
+    def test_failures(self):
+        """Report an error per message when the relay can't be reached."""
+        from tidings.delivery import send_concurrently
+
+        # Grab a port, and then close it so nothing is listening.
+        sink = SMTPSink()
+        port = sink.server_address[1]
+        sink.server_close()
+        with override_settings(
+                EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1',
+                EMAIL_PORT=port):
+            results = send_concurrently(self._messages(3), 2)
+        self.assertEqual(3, len(results))
+        assert all(error is not None for to, error in results)
+
+    def test_bad_backend(self):
+        """Report an error per message, rather than hang, when the backend
+        can't even be loaded."""
+        from tidings.delivery import send_concurrently
+
+        with override_settings(EMAIL_BACKEND='no.such.Backend'):
+            results = send_concurrently(self._messages(10), 2)
+        self.assertEqual(10, len(results))
+        assert all(isinstance(error, ImportError) for to, error in results)
+
+    def test_locmem(self):
+        """Work with other backends too."""
+        from tidings.delivery import send_concurrently
+
+        results = send_concurrently(self._messages(5), 3)
+        self.assertEqual(5, len(mail.outbox))
+        self.assertEqual([None] * 5, [error for to, error in results])
@@ -1,13 +1,22 @@
 # -*- coding: utf-8 -*-
+from unittest import skipUnless
+
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.contenttypes.models import ContentType
 from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
 from django.core.mail import EmailMessage
-from django.test import TestCase, override_settings
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 
 from tidings.compat import range
-from tidings.events import Event, _unique_by_email, EventUnion, InstanceEvent
-from tidings.models import Watch, EmailUser
+from tidings.events import (Event, _unique_by_email, EventUnion, InstanceEvent,
+                            _fire_coalesced, _model_to_fields,
+                            _recipient_ids, _recipients_from_ids,
+                            recipient_query_cache, unwatched_fires)
+from tidings.models import Watch, WatchFilter, EmailUser, delete_watches
+from tidings.utils import cache_key, hash_to_unsigned, tidings_cache
 
 from .base import watch, watch_filter, user
 from .mockapp.models import MockModel
@@ -42,6 +51,35 @@ class FilteredContentTypeEvent(ContentTypeEvent):
     filters = set(['color', 'flavor'])
 
 
+class ShardedEvent(SimpleEvent):
+    shard_size = 2
+
+
+class BatchedEvent(SimpleEvent):
+    mail_batch_size = 2
+
+
+class ConcurrentEvent(SimpleEvent):
+    mail_sessions = 3
+
+
+class StreamingEvent(SimpleEvent):
+    fetch_size = 2
+
+
+class SQLDedupedEvent(SimpleEvent):
+    dedupe_in_sql = True
+
+
+class BatchRecordingBackend(EmailBackend):
+    """Mail backend that remembers the size of each batch it was handed"""
+    batch_sizes = []
+
+    def send_messages(self, messages):
+        self.batch_sizes.append(len(messages))
+        return super(BatchRecordingBackend, self).send_messages(messages)
+
+
 fire_simple_event_called = False
 
 
@@ -224,6 +262,78 @@ class UsersWatchingTests(TestCase):
         _, watches = result[1]
         self.assertEqual(set([w4, w5, w6]), set(watches))
 
+    def test_streaming(self):
+        """Streaming rows a few at a time still merges duplicates that
+        straddle chunk boundaries."""
+        watch(event_type=TYPE, user=user(email='hi@there.com', save=True),
+              save=True)
+        for x in range(3):
+            watch(event_type=TYPE, email='hi@there.com', save=True)
+        watch(event_type=TYPE, email='an@other.com', save=True)
+        self._emails_eq(['an@other.com', 'hi@there.com'], StreamingEvent())
+
+    def test_dedupe_in_sql(self):
+        """Deduping in SQL picks the registered user for each address and
+        gathers all of that address's watches."""
+        jed = user(first_name='Jed', email='HI@there.com', save=True)
+        watches = [watch(event_type=TYPE, email='hi@there.com', save=True),
+                   watch(event_type=TYPE, user=jed, save=True),
+                   watch(event_type=TYPE, email='Hi@There.com', save=True)]
+        lonely = watch(event_type=TYPE, email='an@other.com', save=True)
+
+        # Stream in chunks to cover fetching the extra watches in bulk more
+        # than once.
+        event = SQLDedupedEvent()
+        event.fetch_size = 1
+        users_and_watches = list(event._users_watching_by_filter())
+        self.assertEqual(['HI@there.com', 'an@other.com'],
+                         [u.email for u, w in users_and_watches])
+        u, w = users_and_watches[0]
+        self.assertEqual('Jed', u.first_name)
+        self.assertEqual(set(watches), set(w))
+        u, w = users_and_watches[1]
+        assert isinstance(u, EmailUser)
+        self.assertEqual([lonely], w)
+
+    def test_query_cache(self):
+        """Queries of the same shape are compiled once, whatever the filter
+        values and however the filters are ordered."""
+        watch(event_type=TYPE, email='hi@there.com', save=True)
+        recipient_query_cache.clear()
+        self._emails_eq(['hi@there.com'], FilteredEvent(), color=1, flavor=2)
+        self.assertEqual((0, 1), (recipient_query_cache.hits,
+                                  recipient_query_cache.misses))
+        self._emails_eq(['hi@there.com'], FilteredEvent(), flavor=3, color=4)
+        self.assertEqual((1, 1), (recipient_query_cache.hits,
+                                  recipient_query_cache.misses))
+        self._emails_eq(['hi@there.com'], FilteredEvent(), color=1)
+        self.assertEqual((1, 2), (recipient_query_cache.hits,
+                                  recipient_query_cache.misses))
+
+    def test_model_fields_cached(self):
+        """The field lists of the selected models are built once."""
+        self.assertIs(_model_to_fields(), _model_to_fields())
+
+    def test_recipient_ids(self):
+        """Recipients named by their IDs are fetched back by primary key,
+        less any deleted since."""
+        registered = user(email='B@example.com', save=True)
+        watch(event_type=TYPE, user=registered, save=True)
+        watch(event_type=TYPE, user=registered, save=True)
+        watch(event_type=TYPE, email='b@EXAMPLE.com', save=True)
+        watch(event_type=TYPE, email='a@example.com', save=True)
+        gone = watch(event_type=TYPE, email='c@example.com', save=True)
+        pairs = list(SimpleEvent()._users_watching_by_filter())
+        entries = _recipient_ids(pairs)
+        Watch.objects.filter(pk=gone.pk).delete()
+
+        with self.assertNumQueries(2):
+            fetched = list(_recipients_from_ids(entries))
+        self.assertEqual([(u, ws) for u, ws in pairs if gone not in ws],
+                         fetched)
+        self.assertEqual(registered, fetched[0][0])
+        self.assertEqual(2, len(fetched[0][1]))
+
     def test_unsaved_exclude(self):
         """Excluding an unsaved user should throw a ValueError."""
         self.assertRaises(ValueError,
@@ -280,6 +390,31 @@ class EventUnionTests(TestCase):
         EventUnion(simple_event, another_event).fire()
         self.assertTrue(fire_simple_event_called)
 
+    def test_single_query(self):
+        """A union of plain events fetches its watchers in one query, still
+        merging addresses across events."""
+        watch(event_type=TYPE, email='He@llo.com', save=True)
+        watch(event_type=ANOTHER_TYPE, email='he@LLO.com', save=True)
+        watch(event_type=ANOTHER_TYPE, email='ick@abod.com', save=True)
+        union = EventUnion(SimpleEvent(), AnotherEvent())
+        with self.assertNumQueries(1):
+            users_and_watches = list(union._users_watching())
+        self.assertEqual(['ick@abod.com', 'he@llo.com'],
+                         [u.email.lower() for u, w in users_and_watches])
+        self.assertEqual(2, len(users_and_watches[1][1]))
+
+    @override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+    def test_fire_sharded(self):
+        """A sharded union mails each address once."""
+        SimpleEvent.notify('a@example.com').activate().save()
+        AnotherEvent.notify('A@example.com').activate().save()
+        AnotherEvent.notify('b@example.com').activate().save()
+        union = EventUnion(SimpleEvent(), AnotherEvent())
+        union.shard_size = 1
+        union.fire()
+        self.assertEqual(['a@example.com', 'b@example.com'],
+                         sorted(m.to[0].lower() for m in mail.outbox))
+
     def test_watch_lists(self):
         """Ensure the Union returns every watch a user has."""
         w1 = watch(event_type=TYPE, email='jeff@here.com', save=True)
@@ -314,6 +449,88 @@ class NotificationTests(TestCase):
                                                          flavor=4).pk)
         self.assertEqual(1, Watch.objects.all().count())
 
+    def test_filter_count(self):
+        """Assure notify() records how many filters a watch has, and
+        is_notifying() tells it from watches with more."""
+        u = user(save=True)
+        w = FilteredContentTypeEvent.notify(u, color=3, flavor=4)
+        self.assertEqual(2, Watch.objects.get(pk=w.pk).filter_count)
+        self.assertEqual(2, w.filters.count())
+        assert not FilteredContentTypeEvent.is_notifying(u, color=3)
+
+        # One query, with no subquery per watch:
+        with self.assertNumQueries(1) as context:
+            assert FilteredContentTypeEvent.is_notifying(u, color=3,
+                                                         flavor=4)
+        assert 'count(' not in context.captured_queries[0]['sql'].lower()
+
+    def test_notify_many(self):
+        """Assure notify_many() reuses matching watches and creates the
+        rest with their filters in bulk."""
+        registered, other = user(save=True), user(save=True)
+        existing = FilteredContentTypeEvent.notify(registered, color=3,
+                                                   flavor=4)
+        # Has fewer filters, so doesn't match:
+        FilteredContentTypeEvent.notify(other, color=3)
+        mail.outbox = []
+
+        # Find, insert, re-find by secret (SQLite can't return IDs), and
+        # insert filters:
+        with self.assertNumQueries(4):
+            watches = FilteredContentTypeEvent.notify_many(
+                [registered, 'a@example.com', other, AnonymousUser(),
+                 'b@example.com', 'a@example.com'],
+                color=3, flavor=4)
+
+        self.assertEqual(4, len(watches))
+        self.assertEqual(existing, watches[0])
+        self.assertEqual(['a@example.com', None, 'b@example.com'],
+                         [w.email for w in watches[1:]])
+        self.assertEqual(other, watches[2].user)
+        for w in watches:
+            assert FilteredContentTypeEvent.is_notifying(
+                w.user or w.email, color=3, flavor=4)
+        self.assertEqual([False, True, False],
+                         [w.is_active for w in watches[1:]])
+
+        # Nothing new the second time around:
+        self.assertEqual(
+            watches, FilteredContentTypeEvent.notify_many(
+                [registered, 'a@example.com', other, 'b@example.com'],
+                color=3, flavor=4))
+        self.assertEqual(5, Watch.objects.count())
+
+    def test_stop_notifying_all(self):
+        """Assure stop_notifying_all() deletes every matching watch, even
+        ones with extra filters, along with their filters, in chunks."""
+        FilteredContentTypeEvent.notify('a@example.com', color=1)
+        FilteredContentTypeEvent.notify('b@example.com', color=1, flavor=2)
+        FilteredContentTypeEvent.notify(user(save=True), color=1, flavor=3)
+        kept = [FilteredContentTypeEvent.notify('c@example.com', color=2),
+                FilteredContentTypeEvent.notify('d@example.com'),
+                FilteredEvent.notify('e@example.com', color=1)]
+
+        class ChunkedEvent(FilteredContentTypeEvent):
+            delete_chunk_size = 2
+
+        self.assertEqual(3, ChunkedEvent.stop_notifying_all(color=1))
+        self.assertEqual(sorted(w.pk for w in kept),
+                         sorted(Watch.objects.values_list('pk', flat=True)))
+        self.assertEqual(2, WatchFilter.objects.count())
+        self.assertEqual(0, ChunkedEvent.stop_notifying_all(color=1))
+
+    @override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+    def test_many_parameters(self):
+        """Assure notify_many() and stop_notifying_all() split lookups too
+        big for SQLite's 999 bound parameters."""
+        emails = ['%s@example.com' % n for n in range(1200)]
+        watches = FilteredContentTypeEvent.notify_many(emails, color=1)
+        self.assertEqual(watches, FilteredContentTypeEvent.notify_many(
+            emails, color=1))
+        self.assertEqual(1200, FilteredContentTypeEvent.stop_notifying_all(
+            color=1))
+        self.assertEqual(0, WatchFilter.objects.count())
+
     def test_duplicate_tolerance(self):
         """Assure notify() returns an existing watch if there is a matching
         one.
@@ -414,6 +631,51 @@ class MailTests(TestCase):
         self.assertEqual('Subject!', second_mail.subject)
         self.assertEqual('Body!', second_mail.body)
 
+    @override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+    def test_fire_sharded(self):
+        """Assert a sharded fire mails each address exactly once, even when
+        its watches are spread across users and case variants."""
+        registered_user = user(email='Hi@there.com', save=True)
+        ShardedEvent.notify(registered_user).activate().save()
+        ShardedEvent.notify('hi@THERE.com').activate().save()
+        for address in ['a@example.com', 'b@example.com', 'c@example.com']:
+            ShardedEvent.notify(address).activate().save()
+        excluded_user = user(email='ex@clude.com', save=True)
+        ShardedEvent.notify(excluded_user).activate().save()
+
+        ShardedEvent().fire(exclude=excluded_user)
+
+        self.assertEqual(['Hi@there.com', 'a@example.com', 'b@example.com',
+                          'c@example.com'],
+                         sorted(m.to[0] for m in mail.outbox))
+
+    @override_settings(
+        TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False,
+        EMAIL_BACKEND='tests.test_events.BatchRecordingBackend')
+    def test_batched_delivery(self):
+        """Assert mails reach the backend in batches of mail_batch_size."""
+        for n in range(5):
+            BatchedEvent.notify('%s@example.com' % n).activate().save()
+        BatchRecordingBackend.batch_sizes = []
+
+        event = BatchedEvent()
+        self.assertEqual((5, 0),
+                         event._send_mails(event._users_watching()))
+        self.assertEqual([2, 2, 1], BatchRecordingBackend.batch_sizes)
+        self.assertEqual(5, len(mail.outbox))
+
+    @override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+    def test_concurrent_delivery(self):
+        """Assert mails go out over mail_sessions connections when asked."""
+        for n in range(5):
+            ConcurrentEvent.notify('%s@example.com' % n).activate().save()
+
+        event = ConcurrentEvent()
+        self.assertEqual((5, 0),
+                         event._send_mails(event._users_watching()))
+        self.assertEqual(sorted(['%s@example.com' % n for n in range(5)]),
+                         sorted(m.to[0] for m in mail.outbox))
+
     @override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
     def test_exclude(self):
         """Assert the `exclude` arg to fire() excludes the given user."""
@@ -500,3 +762,346 @@ class InstanceEventTests(TestCase):
         """Watch with a registered user."""
         registered_user = user(email='regist@ered.com', save=True)
         self._test_user_or_email(registered_user)
+
+    def test_is_notifying_many(self):
+        """Tell which of many instances are watched with one query."""
+        registered_user = user(email='regist@ered.com', save=True)
+        m1, m2, m3 = [MockModel.objects.create() for x in range(3)]
+        MockModelEvent.notify(registered_user, m1)
+        MockModelEvent.notify(registered_user, m3)
+        MockModelEvent.notify('fred@example.com', m2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                set([m1.pk, m3.pk]),
+                MockModelEvent.is_notifying_many(registered_user,
+                                                 [m1, m2.pk, m3]))
+        self.assertEqual(set([m2.pk]), MockModelEvent.is_notifying_many(
+            'fred@example.com', [m1, m2, m3]))
+        self.assertEqual(set(), MockModelEvent.is_notifying_many(
+            AnonymousUser(), [m1, m2, m3]))
+
+    def test_mark_notifying(self):
+        """Mark each of a queryset's instances with whether it's watched."""
+        m1, m2 = MockModel.objects.create(), MockModel.objects.create()
+        MockModelEvent.notify('fred@example.com', m2)
+
+        marked = MockModelEvent.mark_notifying(
+            'fred@example.com', MockModel.objects.order_by('pk'),
+            attr='watched')
+        self.assertEqual([(m1, False), (m2, True)],
+                         [(m, m.watched) for m in marked])
+
+
+class CoalescedEvent(InstanceEvent):
+    event_type = 'coalesced event'
+    content_type = MockModel
+    coalesce_window = 10
+
+    def __init__(self, instance, revision):
+        super(CoalescedEvent, self).__init__(instance)
+        self.revision = revision
+
+    def _mails(self, users_and_watches):
+        return (EmailMessage('Revision %s' % self.revision, 'Body',
+                             to=[u.email]) for u, w in users_and_watches)
+
+    def _coalesce_key(self, exclude=None):
+        # Only the latest revision of an instance matters:
+        return 'coalesced event:%s' % self.instance.pk
+
+
+class CoalescedFilteredEvent(FilteredEvent):
+    coalesce_window = 10
+
+    def __init__(self, color):
+        super(CoalescedFilteredEvent, self).__init__()
+        self.color = color
+
+    def _users_watching(self, **kwargs):
+        return self._users_watching_by_filter(color=self.color, **kwargs)
+
+
+@override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+class CoalesceTests(TestCase):
+    """Tests for coalescing fires"""
+
+    def setUp(self):
+        super(CoalesceTests, self).setUp()
+        tidings_cache().clear()
+
+    def _open_window(self, event):
+        """Mark a coalesced fire of ``event`` pending, as if its task were
+        waiting out the window. (Celery runs tasks eagerly in the tests,
+        ignoring the countdown, so the window would otherwise close at
+        once.) Return the key to pass to _fire_coalesced()."""
+        key = cache_key('coalesce', event._coalesce_key())
+        tidings_cache().add(key, True, 10)
+        return key
+
+    def test_coalesce(self):
+        """Run one task per instance per window, with the latest event."""
+        m1, m2 = MockModel.objects.create(), MockModel.objects.create()
+        CoalescedEvent.notify('a@example.com', m1).activate().save()
+        CoalescedEvent.notify('b@example.com', m2).activate().save()
+
+        # Fires of m1 wait for the pending task; m2's has a window to itself:
+        key = self._open_window(CoalescedEvent(m1, 0))
+        for revision in range(1, 4):
+            CoalescedEvent(m1, revision).fire()
+        CoalescedEvent(m2, 1).fire()
+        self.assertEqual([(['b@example.com'], 'Revision 1')],
+                         [(m.to, m.subject) for m in mail.outbox])
+
+        # The task picks up the latest, and closes the window:
+        _fire_coalesced(key)
+        self.assertEqual((['a@example.com'], 'Revision 3'),
+                         (mail.outbox[1].to, mail.outbox[1].subject))
+        CoalescedEvent(m1, 4).fire()
+        self.assertEqual('Revision 4', mail.outbox[2].subject)
+
+        # Undelayed fires aren't coalesced:
+        self._open_window(CoalescedEvent(m1, 0))
+        CoalescedEvent(m1, 5).fire(delay=False)
+        self.assertEqual(4, len(mail.outbox))
+
+    def test_identical_by_default(self):
+        """Coalesce only identical fires unless told otherwise."""
+        CoalescedFilteredEvent.notify('a@example.com', color=1).activate()\
+            .save()
+        CoalescedFilteredEvent.notify('b@example.com', color=2).activate()\
+            .save()
+        key = self._open_window(CoalescedFilteredEvent(1))
+        for color in [1, 2, 1]:
+            CoalescedFilteredEvent(color).fire()
+        self.assertEqual([['b@example.com']], [m.to for m in mail.outbox])
+        _fire_coalesced(key)
+        self.assertEqual([['b@example.com'], ['a@example.com']],
+                         [m.to for m in mail.outbox])
+
+
+class OnCommitEvent(CoalescedEvent):
+    event_type = 'on commit event'
+    coalesce_window = None
+    fire_on_commit = True
+
+
+@override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+class FireOnCommitTests(TransactionTestCase):
+    """Tests for deferring fires until the transaction commits"""
+
+    def test_on_commit(self):
+        """Dispatch after commit, once per distinct event."""
+        m = MockModel.objects.create()
+        OnCommitEvent.notify('a@example.com', m).activate().save()
+
+        with transaction.atomic():
+            OnCommitEvent(m, 1).fire()
+            OnCommitEvent(m, 1).fire()
+            OnCommitEvent(MockModel.objects.get(pk=m.pk), 1).fire()
+            OnCommitEvent(m, 2).fire()
+            self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(['Revision 1', 'Revision 2'],
+                         [m.subject for m in mail.outbox])
+
+        # Outside a transaction, fires go straight out:
+        OnCommitEvent(m, 3).fire()
+        self.assertEqual(3, len(mail.outbox))
+
+    def test_rollback(self):
+        """Drop fires from rolled-back transactions and savepoints."""
+        m = MockModel.objects.create()
+        OnCommitEvent.notify('a@example.com', m).activate().save()
+
+        try:
+            with transaction.atomic():
+                OnCommitEvent(m, 1).fire()
+                raise ValueError
+        except ValueError:
+            pass
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    OnCommitEvent(m, 2).fire()
+                    raise ValueError
+            except ValueError:
+                pass
+            # Not mistaken for the rolled-back ones:
+            OnCommitEvent(m, 1).fire()
+            OnCommitEvent(m, 2).fire()
+        self.assertEqual(['Revision 1', 'Revision 2'],
+                         [m.subject for m in mail.outbox])
+
+    def test_forget_rolled_back(self):
+        """Forget the fires of a rolled-back transaction once it's over."""
+        m = MockModel.objects.create()
+        try:
+            with transaction.atomic():
+                OnCommitEvent(m, 1).fire()
+                self.assertEqual(1, len(connection.tidings_fires))
+                raise ValueError
+        except ValueError:
+            pass
+        OnCommitEvent(m, 2).fire()
+        assert not hasattr(connection, 'tidings_fires')
+
+
+class NotifyManyOnCommitTests(TransactionTestCase):
+    """Tests for queueing notify_many()'s activation emails"""
+
+    def test_on_commit(self):
+        """Send activation emails only once the watches are committed."""
+        with transaction.atomic():
+            FilteredContentTypeEvent.notify_many(
+                ['a@example.com', user(save=True), 'b@example.com'], color=3)
+            self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(['a@example.com', 'b@example.com'],
+                         sorted(m.to[0] for m in mail.outbox))
+
+    def test_rollback(self):
+        """Send no activation emails for rolled-back watches."""
+        try:
+            with transaction.atomic():
+                FilteredContentTypeEvent.notify_many(['a@example.com'],
+                                                     color=3)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(0, Watch.objects.count())
+
+
+class CachedEvent(InstanceEvent):
+    event_type = 'cached event'
+    content_type = MockModel
+    filters = set(['color'])
+    recipient_cache_timeout = 60
+
+
+@override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False,
+                   TIDINGS_CACHE_RECIPIENTS=True)
+class RecipientCacheTests(TestCase):
+    """Tests for caching the recipients of fires"""
+
+    def setUp(self):
+        super(RecipientCacheTests, self).setUp()
+        tidings_cache().clear()
+
+    def _recipients(self, m):
+        return sorted((u.email, sorted(w.pk for w in ws)) for u, ws in
+                      CachedEvent(m)._users_watching_by_filter(
+                          object_id=m.pk, color='red'))
+
+    def test_cache(self):
+        """Fetch cached recipients by ID, until something changes."""
+        m = MockModel.objects.create()
+        u = user(email='u@example.com', save=True)
+        w1 = CachedEvent.notify(u, m)
+        w2 = watch(event_type='cached event', email='u@example.com',
+                   save=True)
+        expected = [('u@example.com', [w1.pk, w2.pk])]
+        self.assertEqual(expected, self._recipients(m))
+
+        # One query for the users and one for the watches:
+        with self.assertNumQueries(2):
+            self.assertEqual(expected, self._recipients(m))
+
+        # Logging in or saving an unchanged email doesn't invalidate;
+        # changing an email does:
+        u.save(update_fields=['last_login'])
+        u.save()
+        with self.assertNumQueries(2):
+            self._recipients(m)
+        u.email = 'v@example.com'
+        u.save()
+        self.assertEqual([('u@example.com', [w2.pk]),
+                          ('v@example.com', [w1.pk])], self._recipients(m))
+
+        # A watch filter not matching the fire's:
+        watch_filter(watch=w1, name='color',
+                     value=hash_to_unsigned('blue'), save=True)
+        self.assertEqual([('u@example.com', [w2.pk])], self._recipients(m))
+
+        # Watches added in bulk or deleted without signals:
+        w3, = CachedEvent.notify_many(['x@example.com'], m.pk)
+        self.assertEqual([('u@example.com', [w2.pk]),
+                          ('x@example.com', [w3.pk])], self._recipients(m))
+        delete_watches([w2.pk, w3.pk])
+        self.assertEqual([], self._recipients(m))
+
+    def test_off(self):
+        """Without TIDINGS_CACHE_RECIPIENTS, track no changes, so watches
+        and their filters can still be fast-deleted, and refuse to cache."""
+        with override_settings(TIDINGS_CACHE_RECIPIENTS=False):
+            for n in range(5):
+                w = watch(event_type=TYPE, save=True)
+                for name in 'abc':
+                    watch_filter(watch=w, name=name, save=True)
+            # Select the watches, then delete their filters and them:
+            with self.assertNumQueries(3):
+                Watch.objects.filter(event_type=TYPE).delete()
+
+            m = MockModel.objects.create()
+            self.assertRaises(ImproperlyConfigured, self._recipients, m)
+
+
+class UnwatchedEvent(CoalescedEvent):
+    event_type = 'unwatched event'
+    coalesce_window = None
+    skip_unwatched = True
+
+
+@override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+class SkipUnwatchedTests(TestCase):
+    """Tests for skipping fires nobody is watching"""
+
+    def setUp(self):
+        super(SkipUnwatchedTests, self).setUp()
+        unwatched_fires.clear()
+
+    def test_skip(self):
+        """Send no task for objects nobody watches."""
+        m1, m2 = MockModel.objects.create(), MockModel.objects.create()
+        UnwatchedEvent.notify('a@example.com', m1)
+        UnwatchedEvent(m1, 1).fire()
+        # One query each to find nobody watching:
+        with self.assertNumQueries(2):
+            UnwatchedEvent(m2, 1).fire()
+            UnwatchedEvent(m2, 2).fire()
+        self.assertEqual([['a@example.com']], [m.to for m in mail.outbox])
+        self.assertEqual((3, 2),
+                         (unwatched_fires.checked, unwatched_fires.skipped))
+
+        # New watches, including wildcards, show up:
+        UnwatchedEvent.notify_many(['b@example.com'], m2.pk)
+        UnwatchedEvent(m2, 3).fire()
+        self.assertEqual(['b@example.com'], mail.outbox[-1].to)
+        m3 = MockModel.objects.create()
+        UnwatchedEvent(m3, 1).fire()
+        self.assertEqual(3, unwatched_fires.skipped)
+        watch(event_type='unwatched event', email='c@example.com',
+              user=None, save=True)
+        UnwatchedEvent(m3, 2).fire()
+        self.assertEqual((['c@example.com'], 'Revision 2'),
+                         (mail.outbox[-1].to, mail.outbox[-1].subject))
+
+        # Inactive watches don't count:
+        Watch.objects.filter(event_type='unwatched event').update(
+            is_active=False)
+        UnwatchedEvent(m1, 2).fire()
+        self.assertEqual(4, unwatched_fires.skipped)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Uses SQLite query plans.')
+    def test_uses_fire_index(self):
+        """Look for watchers through the index made for fires."""
+        m = MockModel.objects.create()
+        plan = UnwatchedEvent(m, 1)._possible_watches(m.pk).explain()
+        self.assertEqual(4, plan.count('tidings_watch_fire_idx'))
+
+    def test_union(self):
+        """Skip a union only if nobody watches any of its events."""
+        m = MockModel.objects.create()
+        union = EventUnion(UnwatchedEvent(m, 1), AnotherEvent())
+        self.assertFalse(union._anyone_watching())
+        watch(event_type=ANOTHER_TYPE, save=True)
+        self.assertTrue(union._anyone_watching())
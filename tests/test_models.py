@@ -1,6 +1,12 @@
+from importlib import import_module
+from unittest import skipUnless
+
+from django.apps import apps
+from django.db import connection
 from django.test import TestCase
 
-from tidings.models import WatchFilter, EmailUser
+from tidings.compat import range
+from tidings.models import Watch, WatchFilter, EmailUser, multi_raw
 
 from .base import watch, watch_filter
 
@@ -20,6 +26,56 @@ class WatchTests(TestCase):
         assert url.startswith('http')
         assert url.endswith('?s=%s' % w.secret)
 
+    def test_indexes(self):
+        """Make sure the migrations build the composite indexes the fire and
+        user lookups use."""
+        with connection.cursor() as cursor:
+            def columns(table, name):
+                return connection.introspection.get_constraints(
+                    cursor, table)[name]['columns']
+
+            self.assertEqual(
+                ['event_type', 'content_type_id', 'object_id', 'is_active'],
+                columns('tidings_watch', 'tidings_watch_fire_idx'))
+            self.assertEqual(
+                ['user_id', 'event_type'],
+                columns('tidings_watch', 'tidings_watch_user_type_idx'))
+            self.assertEqual(
+                ['watch_id', 'name', 'value'],
+                columns('tidings_watchfilter',
+                        'tidings_watchfilter_match_idx'))
+
+    @skipUnless(connection.vendor == 'sqlite', 'Uses SQLite query plans.')
+    def test_email_lower_index(self):
+        """Make sure claim_watches_bulk's case-insensitive email matches can
+        use the lower(email) index."""
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN SELECT id FROM tidings_watch '
+                           "WHERE lower(email) = 'a@example.com'")
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('tidings_watch_email_lower_idx', plan)
+
+
+class MultiRawTests(TestCase):
+    """Tests for multi_raw()"""
+
+    def _watch_ids(self, **kwargs):
+        fields = [f.get_attname() for f in Watch._meta.fields]
+        query = 'SELECT %s FROM tidings_watch ORDER BY id' % ', '.join(fields)
+        return [w.id for w, in multi_raw(query, [], [Watch],
+                                         {Watch: fields}, **kwargs)]
+
+    def test_fetch_all(self):
+        """Hydrate every row by default."""
+        ids = [watch().id for x in range(3)]
+        self.assertEqual(ids, self._watch_ids())
+
+    def test_fetch_size(self):
+        """Streaming in chunks yields the same rows, including a final partial
+        chunk."""
+        ids = [watch().id for x in range(5)]
+        self.assertEqual(ids, self._watch_ids(fetch_size=2))
+
 
 class WatchFilterTests(TestCase):
     """Tests for WatchFilter"""
@@ -34,6 +90,32 @@ class WatchFilterTests(TestCase):
         watch_filter(name='maxint', value=MAX_INT).save()
         self.assertEqual(MAX_INT, WatchFilter.objects.get(name='maxint').value)
 
+    def test_filter_count(self):
+        """Assert saving and deleting filters keeps their watch's
+        filter_count current, in the DB and on the watch itself."""
+        w = watch()
+        first = watch_filter(watch=w, name='a')
+        watch_filter(watch=w, name='b')
+        self.assertEqual(2, w.filter_count)
+        first.delete()
+        self.assertEqual(1, w.filter_count)
+        self.assertEqual(1, Watch.objects.get(pk=w.pk).filter_count)
+
+    def test_backfill(self):
+        """Assert the migration adding filter_count fills it in."""
+        w, unfiltered = watch(), watch()
+        for name in 'abc':
+            watch_filter(watch=w, name=name)
+        Watch.objects.update(filter_count=0)
+
+        migration = import_module('tidings.migrations.0003_watch_filter_count')
+        # count_filters() needs only the editor's connection, and SQLite
+        # won't open a real editor inside the test's transaction:
+        editor = type('Editor', (object,), {'connection': connection})
+        migration.count_filters(apps, editor)
+        self.assertEqual(3, Watch.objects.get(pk=w.pk).filter_count)
+        self.assertEqual(0, Watch.objects.get(pk=unfiltered.pk).filter_count)
+
 
 class EmailUserTests(TestCase):
     """Tests for EmailUser class"""
@@ -0,0 +1,104 @@
+import json
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+
+from tidings.events import EventUnion, InstanceEvent, _event_task
+from tidings.models import EmailUser
+from tidings.payload import decode, encode
+
+from .base import user
+from .mockapp.models import MockModel
+
+
+class PayloadEvent(InstanceEvent):
+    event_type = 'payload event'
+    content_type = MockModel
+    shard_size = 1
+
+    def _mails(self, users_and_watches):
+        for u, w in users_and_watches:
+            yield EmailMessage('Instance %s' % self.instance.pk, 'Body',
+                               'from@example.com', [u.email])
+
+
+def round_trip(value):
+    """Encode ``value``, send it through JSON, and decode it."""
+    return decode(json.loads(json.dumps(encode(value))))
+
+
+class PayloadTests(TestCase):
+    """Tests for encode() and decode()"""
+
+    def test_round_trip(self):
+        """Rebuild nested events, instances, and plain values."""
+        first, second = MockModel.objects.create(), MockModel.objects.create()
+        excluded = user(email='ex@clude.com', save=True)
+        union = EventUnion(PayloadEvent(first), PayloadEvent(second))
+        union.extra = {'tags': set(['a', 'b']), 'pair': (1, None)}
+        encoded = json.loads(json.dumps(
+            encode([union, [excluded, EmailUser('a@example.com')]])))
+
+        # One query per model:
+        with self.assertNumQueries(2):
+            event, excludes = decode(encoded)
+
+        assert isinstance(event, EventUnion)
+        self.assertEqual([first, second],
+                         [e.instance for e in event.events])
+        self.assertEqual({'tags': set(['a', 'b']), 'pair': [1, None]},
+                         event.extra)
+        self.assertEqual([excluded, EmailUser('a@example.com')], excludes)
+        self.assertEqual('ex@clude.com', excludes[0].email)
+
+    def test_unencodable(self):
+        """Refuse things that can't be rebuilt on the other side."""
+        class Local(object):
+            pass
+
+        self.assertRaises(TypeError, encode, MockModel())
+        self.assertRaises(TypeError, encode, Local())
+        self.assertRaises(TypeError, encode, {1: 'one'})
+
+    def test_deleted(self):
+        """Raise DoesNotExist when an instance has gone away."""
+        instance = MockModel.objects.create()
+        encoded = encode(PayloadEvent(instance))
+        instance.delete()
+        self.assertRaises(MockModel.DoesNotExist, decode, encoded)
+
+
+@override_settings(TIDINGS_TASK_SERIALIZER='json',
+                   TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+class JSONFireTests(TestCase):
+    """Tests for firing through JSON task payloads"""
+
+    def test_fire(self):
+        """Fire a sharded instance event with JSON payloads."""
+        instance = MockModel.objects.create()
+        for address in ['a@example.com', 'b@example.com']:
+            PayloadEvent.notify(address, instance).activate().save()
+        excluded = user(email='ex@clude.com', save=True)
+        PayloadEvent.notify(excluded, instance).activate().save()
+
+        event = PayloadEvent(instance)
+        signature = event._task_signature('_fire_task', exclude=excluded)
+        self.assertEqual('json', signature.options['serializer'])
+        json.dumps(signature.args)
+        event.fire(exclude=excluded)
+
+        self.assertEqual(['a@example.com', 'b@example.com'],
+                         sorted(m.to[0] for m in mail.outbox))
+        self.assertEqual(set(['Instance %s' % instance.pk]),
+                         set(m.subject for m in mail.outbox))
+
+    def test_deleted_instance(self):
+        """Drop the fire of an event whose instance is gone."""
+        instance = MockModel.objects.create()
+        PayloadEvent.notify('a@example.com', instance).activate().save()
+        payload = encode([PayloadEvent(instance), [], {}])
+        instance.delete()
+
+        _event_task('_fire_task', payload)
+        self.assertEqual(0, len(mail.outbox))
@@ -1,8 +1,28 @@
-from django.test import TestCase
+from datetime import timedelta
+from smtplib import SMTPException
 
-from tidings.models import Watch
-from tidings.tasks import claim_watches
-from .base import watch, user
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from tidings.events import InstanceEvent
+from tidings.models import PendingNotification, Watch
+from tidings.tasks import (claim_watches, claim_watches_bulk,
+                           send_activation_emails, send_digests)
+from .base import watch, watch_filter, user
+from .mockapp.models import MockModel
+
+
+class RefusingBackend(EmailBackend):
+    """Mail backend that refuses mail to refused@example.com"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'refused@example.com' in message.to:
+                raise SMTPException('Refused')
+        return super(RefusingBackend, self).send_messages(messages)
 
 
 class ClaimWatchesTests(TestCase):
@@ -53,3 +73,123 @@ class ClaimWatchesTests(TestCase):
 
         # No other watches are affected.
         assert Watch.objects.filter(email='no@bo.dy').exists()
+
+
+@override_settings(EMAIL_BACKEND='tests.test_tasks.RefusingBackend')
+class SendActivationEmailsTests(TestCase):
+    def test_send(self):
+        """Mail each inactive watch, deleting those that can't be mailed."""
+        w1 = watch(user=None, email='a@example.com', is_active=False,
+                   save=True)
+        w2 = watch(user=None, email='refused@example.com', is_active=False,
+                   save=True)
+        w3 = watch(user=None, email='b@example.com', is_active=True,
+                   save=True)
+
+        send_activation_emails('tests.test_events.SimpleEvent',
+                               [w1.pk, w2.pk, w3.pk])
+
+        self.assertEqual([['a@example.com']], [m.to for m in mail.outbox])
+        self.assertEqual([w1.pk, w3.pk],
+                         sorted(Watch.objects.values_list('pk', flat=True)))
+
+
+class ClaimWatchesBulkTests(TestCase):
+    def test_claim(self):
+        """Claim case-insensitively, merge duplicates, and leave the rest."""
+        alice = user(email='Alice@example.com', save=True)
+        bob = user(email='bob@example.com', save=True)
+        nobody = user(email='', save=True)
+        # Alice already has an inactive watch like this anonymous one:
+        mine = watch(user=alice, event_type='a', is_active=False, save=True)
+        anonymous = watch(user=None, email='alice@EXAMPLE.com',
+                          event_type='a', is_active=True, save=True)
+        different = watch(user=None, email='alice@example.com',
+                          event_type='b', save=True)
+        watch_filter(watch=different, name='color', value=1)
+        bobs = watch(user=None, email='bob@example.com', save=True)
+        other = watch(user=None, email='carol@example.com', save=True)
+        blank = watch(user=None, email='', save=True)
+
+        self.assertEqual({'claimed': 3, 'merged': 1},
+                         claim_watches_bulk([alice, bob.pk, nobody],
+                                            batch_size=2))
+
+        self.assertEqual(
+            [(mine.pk, alice.pk, None, True),
+             (different.pk, alice.pk, None, True),
+             (bobs.pk, bob.pk, None, True),
+             (other.pk, None, 'carol@example.com', True),
+             (blank.pk, None, '', True)],
+            list(Watch.objects.order_by('pk').values_list(
+                'pk', 'user', 'email', 'is_active')))
+        assert not Watch.objects.filter(pk=anonymous.pk).exists()
+
+
+class LatestDigestEvent(InstanceEvent):
+    event_type = 'latest digest event'
+    content_type = MockModel
+    digest_window = 3600
+
+    def _mails(self, users_and_watches):
+        for u, w in users_and_watches:
+            yield EmailMessage('Latest', str(self.instance.pk), to=[u.email])
+
+
+class DigestEvent(LatestDigestEvent):
+    event_type = 'digest event'
+
+    def _digest_mails(self, events, users_and_watches):
+        body = ' '.join(str(e.instance.pk) for e in events)
+        for u, w in users_and_watches:
+            yield EmailMessage('Digest', body, to=[u.email])
+
+
+@override_settings(TIDINGS_CONFIRM_ANONYMOUS_WATCHES=False)
+class SendDigestsTests(TestCase):
+    def test_digest(self):
+        """Send each recipient one mail covering all their events from the
+        window, leaving out those they were excluded from."""
+        m1, m2 = MockModel.objects.create(), MockModel.objects.create()
+        poster = user(email='poster@example.com', save=True)
+        for who, instance in [('a@example.com', m1), ('a@example.com', m2),
+                              ('b@example.com', m1), (poster, m1)]:
+            DigestEvent.notify(who, instance).activate().save()
+
+        DigestEvent(m1).fire()
+        DigestEvent(m2).fire(delay=False)
+        DigestEvent(m1).fire(exclude=poster)
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(3, PendingNotification.objects.count())
+
+        # The window hasn't run out yet:
+        send_digests()
+        self.assertEqual(0, len(mail.outbox))
+
+        PendingNotification.objects.update(
+            created=timezone.now() - timedelta(hours=2))
+        send_digests()
+        self.assertEqual(
+            [(['a@example.com'], '%s %s %s' % (m1.pk, m2.pk, m1.pk)),
+             (['b@example.com'], '%s %s' % (m1.pk, m1.pk)),
+             (['poster@example.com'], '%s' % m1.pk)],
+            sorted((m.to, m.body) for m in mail.outbox))
+        self.assertEqual(0, PendingNotification.objects.count())
+
+    def test_latest(self):
+        """By default, send each recipient the mail of just the latest of
+        their events from the window."""
+        m1, m2 = MockModel.objects.create(), MockModel.objects.create()
+        for who, instance in [('a@example.com', m1), ('a@example.com', m2),
+                              ('b@example.com', m1)]:
+            LatestDigestEvent.notify(who, instance).activate().save()
+
+        LatestDigestEvent(m1).fire()
+        LatestDigestEvent(m2).fire()
+        LatestDigestEvent(m1).fire()
+        PendingNotification.objects.update(
+            created=timezone.now() - timedelta(hours=2))
+        send_digests()
+        self.assertEqual([(['a@example.com'], str(m1.pk)),
+                          (['b@example.com'], str(m1.pk))],
+                         sorted((m.to, m.body) for m in mail.outbox))
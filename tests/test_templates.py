@@ -1,9 +1,9 @@
 from django.test import TestCase
 
-from tidings.models import Watch
+from tidings.models import Watch, WatchFilter, one_click_unsubscribe_url
 from tidings.utils import reverse
 
-from .base import watch
+from .base import user, watch, watch_filter
 
 
 FAILURE_STRING = 'We could not find your subscription'
@@ -48,3 +48,53 @@ class UnsubscribeTests(TestCase):
             reverse('tidings.unsubscribe', args=[w.pk]) + '?s=' + w.secret)
         self.assertContains(response, '<h1>Unsubscribed</h1>')
         self.assertEqual(0, Watch.objects.count())
+
+
+class OneClickUnsubscribeTests(TestCase):
+    """Integration tests for one_click_unsubscribe view"""
+
+    def _post(self, url):
+        return self.client.post(url[url.index('/unsubscribe'):],
+                                {'List-Unsubscribe': 'One-Click'})
+
+    def test_watches(self):
+        """Delete just the token's watches and their filters."""
+        w1, w2, other = watch(), watch(), watch()
+        watch_filter(watch=w1)
+        response = self._post(one_click_unsubscribe_url(watches=[w1, w2]))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'', response.content)
+        self.assertEqual([other.pk],
+                         list(Watch.objects.values_list('pk', flat=True)))
+        self.assertEqual(0, WatchFilter.objects.count())
+
+    def test_email(self):
+        """Delete every watch of an email address, registered or not."""
+        registered = user(email='Some@example.com', save=True)
+        watch(user=registered)
+        watch(user=None, email='some@example.com')
+        other = watch(user=None, email='other@example.com')
+        response = self._post(
+            one_click_unsubscribe_url(email='some@example.com'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([other.pk],
+                         list(Watch.objects.values_list('pk', flat=True)))
+
+    def test_cheap(self):
+        """Check the token without looking anything up."""
+        url = one_click_unsubscribe_url(watches=[watch()])
+        # Two DELETEs, plus the savepoint around them:
+        with self.assertNumQueries(4):
+            self._post(url)
+        with self.assertNumQueries(4):
+            self.assertEqual(200, self._post(url).status_code)
+
+    def test_bad_token(self):
+        """Refuse tampered tokens and GETs."""
+        w = watch()
+        url = one_click_unsubscribe_url(watches=[w])
+        tampered = url[:-1] + ('A' if url[-1] != 'A' else 'B')
+        self.assertEqual(400, self._post(tampered).status_code)
+        self.assertEqual(
+            405, self.client.get(url[url.index('/unsubscribe'):]).status_code)
+        self.assertEqual(1, Watch.objects.count())
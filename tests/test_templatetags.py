@@ -1,6 +1,9 @@
+from django.contrib.sites.models import Site
 from django.test import TestCase
 from django.template import Context, Template
 
+from tidings.models import URL_BUILDER, URLBuilder
+
 from .base import watch
 
 
@@ -14,3 +17,19 @@ class Tests(TestCase):
         template = Template('{% load unsubscribe_instructions %}'
                             '{% unsubscribe_instructions watch %}')
         assert w.unsubscribe_url() in template.render(Context({'watch': w}))
+
+    def test_url_builder(self):
+        """Make sure unsubscribe_instructions uses a URLBuilder from the
+        context, which looks the site up only once."""
+        watches = [watch(save=True) for x in range(3)]
+        template = Template('{% load unsubscribe_instructions %}'
+                            '{% for w in watches %}'
+                            '{% unsubscribe_instructions w %}'
+                            '{% endfor %}')
+        urls = URLBuilder()
+        Site.objects.clear_cache()
+        with self.assertNumQueries(1):
+            rendered = template.render(Context({'watches': watches,
+                                                URL_BUILDER: urls}))
+        for w in watches:
+            assert w.unsubscribe_url() in rendered
@@ -2,7 +2,11 @@ from django.core.exceptions import ImproperlyConfigured
 from django.test import override_settings, TestCase
 
 from tidings.compat import range, reduce
-from tidings.utils import collate, import_from_setting
+from tidings.models import EmailUser, one_click_unsubscribe_url
+from tidings.utils import (chunked, collate, emails_with_users_and_watches,
+                           import_from_setting)
+
+from .base import watch
 
 
 class MergeTests(TestCase):
@@ -31,6 +35,18 @@ class MergeTests(TestCase):
         """Work when only 1 iterable is passed."""
         self.assertEqual([0, 1], list(collate(range(2))))
 
+    def test_stable(self):
+        """Items with equal keys come out in the order of their iterables,
+        reversed when reverse=True, just as they always have."""
+        iterables = [[(1, 'a'), (2, 'a')], [(1, 'b'), (2, 'b')],
+                     [(1, 'c')]]
+        self.assertEqual([(1, 'a'), (1, 'b'), (1, 'c'), (2, 'a'), (2, 'b')],
+                         list(collate(*iterables, key=lambda x: x[0])))
+        iterables = [list(reversed(it)) for it in iterables]
+        self.assertEqual([(2, 'b'), (2, 'a'), (1, 'c'), (1, 'b'), (1, 'a')],
+                         list(collate(*iterables, key=lambda x: x[0],
+                                      reverse=True)))
+
     def test_reverse(self):
         """Test the `reverse` kwarg."""
         iterables = [range(4, 0, -1), range(7, 0, -1), range(3, 6, -1)]
@@ -40,6 +56,89 @@ class MergeTests(TestCase):
                          list(collate(*iterables, reverse=True)))
 
 
+class ChunkedTests(TestCase):
+    """Unit tests for chunked()"""
+
+    def test_chunks(self):
+        """Chunks are full-sized except maybe the last."""
+        self.assertEqual([[0, 1, 2], [3, 4, 5], [6]],
+                         list(chunked(range(7), 3)))
+
+    def test_empty(self):
+        """No items means no chunks."""
+        self.assertEqual([], list(chunked([], 3)))
+
+
+class RenderCounter(object):
+    """Template variable that counts how many times it was rendered"""
+    renders = 0
+
+    def __str__(self):
+        self.renders += 1
+        return 'Post!'
+
+
+class EmailsWithUsersAndWatchesTests(TestCase):
+    """Tests for emails_with_users_and_watches()"""
+
+    def _bodies(self, **kwargs):
+        post = RenderCounter()
+        users_and_watches = [(EmailUser('a@example.com'), [watch()]),
+                             (EmailUser('b@example.com'), [watch(), watch()])]
+        mails = list(emails_with_users_and_watches(
+            'Subject', 'tests/email.txt', {'post': post, 'tags': ['x', 'y']},
+            users_and_watches, **kwargs))
+        self.assertEqual([['a@example.com'], ['b@example.com']],
+                         [m.to for m in mails])
+        return [m.body for m in mails], post.renders
+
+    def test_render(self):
+        """Render the whole template for each recipient."""
+        bodies, renders = self._bodies()
+        self.assertEqual(['Hi, a@example.com!\nPost!\nx:x/1\ny:y/1\n\n',
+                          'Hi, b@example.com!\nPost!\nx:x/2\ny:y/2\n\n'],
+                         bodies)
+        self.assertEqual(2, renders)
+
+    def test_splice(self):
+        """Render the shared parts once and splice in the per-recipient
+        blocks, which still see loop variables."""
+        self.assertEqual(self._bodies()[0], self._bodies(splice=True)[0])
+        self.assertEqual(1, self._bodies(splice=True)[1])
+
+    def test_splice_autoescape_off(self):
+        """Render per-recipient blocks with the autoescaping around them."""
+        users_and_watches = [(EmailUser("o'brien&co@example.com"), [watch()])]
+        for splice in [False, True]:
+            mail, = emails_with_users_and_watches(
+                'Subject', 'tests/plain_email.txt', {}, users_and_watches,
+                splice=splice)
+            self.assertEqual("Hi, o'brien&co@example.com!\n", mail.body)
+
+    def test_processes(self):
+        """Render in a process pool, keeping the recipients' order."""
+        self.assertEqual(self._bodies()[0],
+                         self._bodies(processes=2, chunk_size=1)[0])
+        self.assertEqual(self._bodies()[0],
+                         self._bodies(processes=2, chunk_size=1,
+                                      splice=True)[0])
+
+    def test_list_unsubscribe(self):
+        """Offer one-click deletion of each recipient's watches, keeping
+        any other headers."""
+        watches = [watch(), watch()]
+        mail, = emails_with_users_and_watches(
+            'Subject', 'tests/email.txt', {},
+            [(EmailUser('a@example.com'), watches)],
+            list_unsubscribe=True, headers={'X-Other': 'yes'})
+        self.assertEqual('yes', mail.extra_headers['X-Other'])
+        self.assertEqual('List-Unsubscribe=One-Click',
+                         mail.extra_headers['List-Unsubscribe-Post'])
+        self.assertEqual(
+            '<%s>' % one_click_unsubscribe_url(watches=watches),
+            mail.extra_headers['List-Unsubscribe'])
+
+
 class ImportedFromSettingTests(TestCase):
     """Tests for import_from_setting() and _imported_symbol()"""
 
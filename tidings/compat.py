@@ -4,15 +4,16 @@
 try:
     # Django 2.2 and earlier include six, but it is only
     # needed for Python 2.7 under Django 1.11.
-    from django.utils.six import (iteritems, iterkeys, string_types, next,
-                                  text_type)
-    from django.utils.six.moves import range, reduce
+    from django.utils.six import (iteritems, iterkeys, itervalues,
+                                  string_types, next, text_type)
+    from django.utils.six.moves import queue, range, reduce
 except ImportError:
     # Django 3.0 drops the six library, but only runs under Python 3
     # Copy Python 3 variants from https://github.com/benjaminp/six
 
     from functools import reduce
-    assert reduce  # Make flake8 happier
+    import queue
+    assert reduce and queue  # Make flake8 happier
 
     def iteritems(d, **kw):
         return iter(d.items(**kw))
@@ -20,6 +21,9 @@ except ImportError:
     def iterkeys(d, **kw):
         return iter(d.keys(**kw))
 
+    def itervalues(d, **kw):
+        return iter(d.values(**kw))
+
     string_types = str,
     text_type = str
 
@@ -33,3 +37,28 @@ try:
     from collections.abc import Sequence  # noqa: F401
 except ImportError:
     from collections import Sequence  # noqa: F401
+
+# heapq only has private max-heap functions, and Python 2.7 lacks
+# _heappop_max and _heapreplace_max. Those are built from the same sift
+# helpers as they are in Python 3.
+try:
+    from heapq import (_heapify_max as heapify_max,  # noqa: F401
+                       _heappop_max as heappop_max,
+                       _heapreplace_max as heapreplace_max)
+except ImportError:
+    from heapq import _heapify_max as heapify_max, _siftup_max  # noqa: F401
+
+    def heappop_max(heap):
+        lastelt = heap.pop()
+        if heap:
+            returnitem = heap[0]
+            heap[0] = lastelt
+            _siftup_max(heap, 0)
+            return returnitem
+        return lastelt
+
+    def heapreplace_max(heap, item):
+        returnitem = heap[0]
+        heap[0] = item
+        _siftup_max(heap, 0)
+        return returnitem
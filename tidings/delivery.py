@@ -0,0 +1,73 @@
+"""Concurrent mail delivery for fires, over several backend connections
+
+:mod:`tidings.events` imports it only when an event asks for more than one
+mail session.
+
+"""
+from smtplib import SMTPException
+import threading
+
+from django.core import mail
+
+from .compat import queue, range
+
+
+def send_concurrently(messages, sessions):
+    """Send ``messages`` over ``sessions`` mail backend connections at once.
+
+    Return a list of (recipients, error) pairs, one per message, where
+    ``error`` is the exception sending it raised, or None if it was sent.
+
+    Sending is latency-bound, so several SMTP sessions to a relay multiply
+    throughput. Each session runs in a thread of its own, since the standard
+    library's SMTP client blocks. ``messages`` is consumed in the calling
+    thread--where it can safely touch the DB--and only a couple of messages
+    per session are buffered, so a slow relay slows the producer down rather
+    than piling up mail in memory.
+
+    """
+    pending = queue.Queue(maxsize=sessions * 2)
+    results = []
+
+    def session():
+        # Whatever goes wrong, keep draining the queue, so the producer never
+        # blocks on a session that's given up.
+        try:
+            connection, open_error = mail.get_connection(), None
+            connection.open()
+        except Exception as exc:
+            connection, open_error = None, exc
+        try:
+            while True:
+                message = pending.get()
+                if message is None:
+                    break
+                try:
+                    if connection is None:
+                        raise open_error
+                    sent = connection.send_messages([message])
+                except Exception as exc:
+                    results.append((message.to, exc))
+                else:
+                    results.append((message.to, None if sent else
+                                    SMTPException('Message was not sent.')))
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass  # Everything's been sent or failed by now.
+
+    workers = [threading.Thread(target=session) for x in range(sessions)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    try:
+        for message in messages:
+            pending.put(message)
+    finally:
+        for worker in workers:
+            pending.put(None)
+        for worker in workers:
+            worker.join()
+    return results
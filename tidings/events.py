@@ -1,17 +1,34 @@
+from collections import OrderedDict
+import json
 from smtplib import SMTPException
+import logging
+from operator import or_
 import random
+import time
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 from django.core import mail
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.db import connections, router, transaction
 from django.db.models import Q
 
+from celery import group
 from celery.task import task
 
-from .compat import Sequence, iteritems, iterkeys, string_types, range
-from .models import Watch, WatchFilter, EmailUser, multi_raw
-from .utils import collate, hash_to_unsigned
+from .compat import (Sequence, iteritems, iterkeys, itervalues, reduce,
+                     string_types, range)
+from .models import (Watch, WatchFilter, EmailUser, PendingNotification,
+                     delete_watches, multi_raw)
+from .payload import decode, encode
+from .tasks import send_activation_emails
+from .utils import (cache_key, chunked, collate, hash_to_unsigned,
+                    invalidate_recipients, recipient_cache_enabled,
+                    recipient_generation, tidings_cache)
+
+
+log = logging.getLogger('tidings.events')
 
 
 class ActivationRequestFailed(Exception):
@@ -20,6 +37,20 @@ class ActivationRequestFailed(Exception):
         self.msgs = msgs
 
 
+def _ensure_user_has_email(user, email):
+    """Make sure the user in a user-watch pair has an email address.
+
+    The caller guarantees us an email from either the user or the watch. If the
+    passed-in user has no email, we return an EmailUser instead having the
+    email address from the watch.
+
+    """
+    # Some of these cases shouldn't happen, but we're tolerant.
+    if not getattr(user, 'email', ''):
+        user = EmailUser(email)
+    return user
+
+
 def _unique_by_email(users_and_watches):
     """Given a sequence of (User/EmailUser, [Watch, ...]) pairs
     clustered by email address (which is never ''), yield from each
@@ -36,23 +67,9 @@ def _unique_by_email(users_and_watches):
 
     Compares email addresses case-insensitively.
 
-    """
-    def ensure_user_has_email(user, cluster_email):
-        """Make sure the user in the user-watch pair has an email address.
-
-        The caller guarantees us an email from either the user or the watch. If
-        the passed-in user has no email, we return an EmailUser instead having
-        the email address from the watch.
-
-        """
-        # Some of these cases shouldn't happen, but we're tolerant.
-        if not getattr(user, 'email', ''):
-            user = EmailUser(cluster_email)
-        return user
-
-    # TODO: Do this instead with clever SQL that somehow returns just the
-    # best row for each email.
+    :attr:`Event.dedupe_in_sql` does the same job in the DB where it can.
 
+    """
     cluster_email = ''  # email of current cluster
     favorite_user = None  # best user in cluster so far
     watches = []  # all watches in cluster
@@ -63,7 +80,7 @@ def _unique_by_email(users_and_watches):
             # Starting a new cluster.
             if cluster_email != '':
                 # Ship the favorites from the previous cluster:
-                yield (ensure_user_has_email(favorite_user, cluster_email),
+                yield (_ensure_user_has_email(favorite_user, cluster_email),
                        watches)
             favorite_user, watches = u, []
             cluster_email = row_email
@@ -72,7 +89,355 @@ def _unique_by_email(users_and_watches):
             favorite_user = u
         watches.extend(w)
     if favorite_user is not None:
-        yield ensure_user_has_email(favorite_user, cluster_email), watches
+        yield _ensure_user_has_email(favorite_user, cluster_email), watches
+
+
+#: SQL expression for the lowercased address a (User, Watch) row would be
+#: mailed at. All the rows for one recipient share it.
+RECIPIENT_KEY_SQL = ('lower(CASE WHEN length(u.email)>0 THEN u.email '
+                     'ELSE w.email END)')
+
+# Per-vendor window aggregates that gather the IDs of all of a recipient's
+# watches into one comma-separated string. Backends missing from here dedupe
+# in Python instead.
+_WATCH_ID_AGGREGATES = {
+    'postgresql': "string_agg(CAST(w.id AS varchar), ',')",
+    'sqlite': "group_concat(w.id, ',')",
+}
+
+
+# Field attnames of the User and Watch models, per user model, as built by
+# _model_to_fields()
+_fields_by_user_model = {}
+
+
+def _model_to_fields():
+    """Return a map of the User and Watch models to the attnames of their
+    fields, in the order the recipient queries select them.
+
+    Models don't change once loaded, so the map is built once per process
+    (per user model, in case a test swaps it).
+
+    """
+    def get_fields(model):
+        if hasattr(model._meta, '_fields'):
+            # For django versions < 1.6
+            return model._meta._fields()
+        else:
+            # For django versions >= 1.6
+            return model._meta.fields
+
+    User = get_user_model()
+    try:
+        return _fields_by_user_model[User]
+    except KeyError:
+        fields = _fields_by_user_model[User] = dict(
+            (m, [f.get_attname() for f in get_fields(m)])
+            for m in [User, Watch])
+        return fields
+
+
+class _QueryCache(object):
+    """Process-wide cache of the SQL text of recipient queries
+
+    A recipient query's text depends only on its shape--the event class, the
+    names of the filters, whether there's a content type and object ID, how
+    many users are excluded, and so on--never on the values bound to it. So
+    each shape is compiled once, and later fires of the same shape only bind
+    params. ``hits`` and ``misses`` count lookups, to show it working under
+    load.
+
+    """
+    def __init__(self):
+        self._queries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, shape, compile):
+        """Return the SQL for ``shape``, calling ``compile()`` to make it if
+        it isn't cached yet."""
+        try:
+            query = self._queries[shape]
+        except KeyError:
+            self.misses += 1
+            query = self._queries[shape] = compile()
+        else:
+            self.hits += 1
+        return query
+
+    def clear(self):
+        """Forget all compiled queries, and zero the counters."""
+        self._queries.clear()
+        self.hits = self.misses = 0
+
+
+#: The process-wide :class:`_QueryCache` of recipient queries
+recipient_query_cache = _QueryCache()
+
+
+class _SkipCounter(object):
+    """Process-wide counts of the fires of events having
+    :attr:`Event.skip_unwatched` set: ``checked`` for those that asked
+    whether anyone was watching, and ``skipped`` for those nobody was"""
+
+    def __init__(self):
+        self.checked = 0
+        self.skipped = 0
+
+    def clear(self):
+        """Zero the counters."""
+        self.checked = self.skipped = 0
+
+
+#: The process-wide :class:`_SkipCounter`
+unwatched_fires = _SkipCounter()
+
+
+def _recipient_ids(users_and_watches):
+    """Return a list of (user ID or None, email, [watch IDs]) entries naming
+    the (User/EmailUser, [Watch]) pairs in ``users_and_watches``."""
+    return [(user.pk, user.email, [w.pk for w in watches])
+            for user, watches in users_and_watches]
+
+
+def _recipients_from_ids(entries, fetch_size=None):
+    """Yield the (User/EmailUser, [Watch]) pairs named by
+    :func:`_recipient_ids()` ``entries``, fetching them by primary key.
+
+    Users and watches deleted since are left out.
+
+    """
+    User = get_user_model()
+    for chunk in chunked(entries, fetch_size or 500):
+        user_ids = set(uid for uid, email, ids in chunk if uid)
+        users = User._default_manager.in_bulk(user_ids) if user_ids else {}
+        watches = Watch.objects.in_bulk(
+            [i for uid, email, ids in chunk for i in ids])
+        for uid, email, ids in chunk:
+            found = [watches[i] for i in ids if i in watches]
+            if not found or (uid and uid not in users):
+                continue
+            yield (_ensure_user_has_email(users[uid], email) if uid
+                   else EmailUser(email)), found
+
+
+class _RecipientQuery(object):
+    """Lazy iterable of the (User/EmailUser, [Watch]) pairs returned by
+    :meth:`Event._users_watching_by_filter()`
+
+    The query isn't run until iteration.
+
+    :arg shape: a tuple of (event class, sorted filter names, whether there's
+      a content type, whether there's an object ID, number of excluded users)
+    :arg params: the values to bind, in the order the compiled SQL wants them
+    :arg cache_timeout: if set, remember the IDs of the recipients and
+      watches found, for this many seconds, in :func:`tidings_cache()`
+
+    """
+    def __init__(self, shape, params, fetch_size=None, dedupe_in_sql=False,
+                 cache_timeout=None):
+        self.shape = shape
+        self.params = params
+        self.fetch_size = fetch_size
+        self.dedupe_in_sql = dedupe_in_sql
+        self.cache_timeout = cache_timeout
+
+    def _sql(self, variant, vendor):
+        """Return the SQL text of my ``variant`` query for ``vendor``'s DB,
+        from :data:`recipient_query_cache` if it has been compiled before."""
+        return recipient_query_cache.get(
+            self.shape + (variant, vendor),
+            lambda: self._compile(variant, vendor))
+
+    def _compile(self, variant, vendor):
+        """Build the SQL text of my ``variant`` query: ``'rows'`` for one row
+        per watch or ``'deduped'`` for one row per recipient.
+        ``'union_rows'`` is an unordered version of ``'rows'`` with a
+        ``recipient_key`` column, for :class:`_UnionQuery` to combine."""
+        (event_class, filter_names, has_content_type, has_object_id,
+         exclude_count) = self.shape
+
+        # Apply watchfilter constraints. Not a one-liner. You're welcome. :-)
+        joins, wheres = [], []
+        for n in range(len(filter_names)):
+            joins.append('LEFT JOIN tidings_watchfilter f{n} '
+                         'ON f{n}.watch_id=w.id '
+                         'AND f{n}.name=%s'.format(n=n))
+            wheres.append('(f{n}.value=%s '
+                          'OR f{n}.value IS NULL)'.format(n=n))
+
+        # Start off with event_type, which is always a constraint. These go in
+        # the `wheres` list to guarantee that the AND after the {wheres}
+        # substitution in the query is okay.
+        wheres.append('w.event_type=%s')
+
+        # Constrain on other 1-to-1 attributes:
+        if has_content_type:
+            wheres.append('(w.content_type_id IS NULL '
+                          'OR w.content_type_id=%s)')
+        if has_object_id:
+            wheres.append('(w.object_id IS NULL OR w.object_id=%s)')
+        if exclude_count:
+            wheres.append('(u.id IS NULL OR u.id NOT IN (%s))' %
+                          ', '.join(['%s'] * exclude_count))
+
+        User = get_user_model()
+        from_where = ('FROM tidings_watch w '
+                      'LEFT JOIN {user_table} u ON u.id=w.user_id {joins} '
+                      'WHERE {wheres} '
+                      'AND (length(w.email)>0 OR length(u.email)>0) '
+                      'AND w.is_active').format(
+            user_table=User._meta.db_table,
+            joins=' '.join(joins),
+            wheres=' AND '.join(wheres))
+
+        model_to_fields = _model_to_fields()
+        if variant in ('rows', 'union_rows'):
+            query_fields = [
+                'u.{0}'.format(field) for field in model_to_fields[User]]
+            query_fields.extend([
+                'w.{0}'.format(field) for field in model_to_fields[Watch]])
+            if variant == 'union_rows':
+                return 'SELECT {fields}, {key} AS recipient_key {from_where}'\
+                    .format(fields=', '.join(query_fields),
+                            key=RECIPIENT_KEY_SQL,
+                            from_where=from_where)
+            # IIRC, the DESC ordering was something to do with the placement
+            # of NULLs. Track this down and explain it.
+            return ('SELECT {fields} {from_where} '
+                    'ORDER BY u.email DESC, w.email DESC').format(
+                fields=', '.join(query_fields), from_where=from_where)
+
+        inner_fields, outer_fields = [], []
+        for alias, model in [('u', User), ('w', Watch)]:
+            for field in model_to_fields[model]:
+                inner_fields.append('{0}.{1} AS {0}_{1}'.format(alias, field))
+                outer_fields.append('{0}_{1}'.format(alias, field))
+        return ('SELECT {outer}, watch_ids FROM ('
+                'SELECT {inner}, {key} AS recipient_key, '
+                'ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY '
+                'CASE WHEN length(u.email)>0 THEN 0 ELSE 1 END, w.id) '
+                'AS recipient_rank, '
+                '{aggregate} OVER (PARTITION BY {key}) AS watch_ids '
+                '{from_where}) recipients '
+                'WHERE recipient_rank=1 '
+                'ORDER BY recipient_key DESC').format(
+            outer=', '.join(outer_fields),
+            inner=', '.join(inner_fields),
+            key=RECIPIENT_KEY_SQL,
+            aggregate=_WATCH_ID_AGGREGATES[vendor],
+            from_where=from_where)
+
+    def __iter__(self):
+        if self.cache_timeout:
+            return self._iter_cached()
+        return self._iter_from_db()
+
+    def _iter_cached(self):
+        """Yield my pairs as rebuilt from the IDs cached by an earlier
+        iteration, or else from the DB, caching their IDs once all are
+        through.
+
+        The cache key includes :func:`~tidings.utils.recipient_generation()`,
+        so changes to watches, their filters, or users retire it. Rebuilding
+        fetches the users and watches by primary key; any since deleted are
+        left out.
+
+        """
+        cache = tidings_cache()
+        key = cache_key('recipients',
+                        recipient_generation(self.shape[0].event_type),
+                        repr(self.shape[1:]), repr(self.params))
+        entries = cache.get(key)
+        if entries is not None:
+            for pair in _recipients_from_ids(entries, self.fetch_size):
+                yield pair
+            return
+
+        entries = []
+        for user, watches in self._iter_from_db():
+            entries.append((user.pk, user.email, [w.pk for w in watches]))
+            yield user, watches
+        cache.set(key, entries, self.cache_timeout)
+
+    def _iter_from_db(self):
+        User = get_user_model()
+        connection = connections[router.db_for_read(Watch)]
+        if (self.dedupe_in_sql and
+                getattr(connection.features, 'supports_over_clause', False) and
+                connection.vendor in _WATCH_ID_AGGREGATES):
+            return self._iter_deduped_in_sql(
+                self._sql('deduped', connection.vendor))
+
+        # Put watch in a list just for consistency. Once the pairs go through
+        # _unique_by_email, watches will be in a list, and EventUnion uses the
+        # same function to union already-list-enclosed pairs from individual
+        # events.
+        return _unique_by_email((u, [w]) for u, w in
+                                multi_raw(self._sql('rows', connection.vendor),
+                                          self.params, [User, Watch],
+                                          _model_to_fields(),
+                                          fetch_size=self.fetch_size))
+
+    def _iter_deduped_in_sql(self, query):
+        """Yield the same pairs as :func:`_unique_by_email()` would, but let
+        the DB pick the best row for each recipient.
+
+        A window function ranks each recipient's rows so a user with an email
+        address comes first, and another gathers the IDs of all their watches,
+        so only one row per recipient comes over the wire. Any watches beyond
+        the one in that row are then fetched in bulk.
+
+        """
+        rows = multi_raw(query, self.params, [get_user_model(), Watch],
+                         _model_to_fields(), fetch_size=self.fetch_size)
+        for chunk in chunked(rows, self.fetch_size or 500):
+            recipients = []
+            other_ids = set()
+            for u, w, watch_ids in chunk:
+                ids = [i for i in map(int, watch_ids.split(','))
+                       if i != w.id]
+                other_ids.update(ids)
+                recipients.append((u, w, ids))
+            others = Watch.objects.in_bulk(other_ids) if other_ids else {}
+            for u, w, ids in recipients:
+                watches = [w] + [others[i] for i in ids if i in others]
+                yield _ensure_user_has_email(u, w.email), watches
+
+
+class _UnionQuery(object):
+    """Lazy iterable of the (User/EmailUser, [Watch]) pairs watching any of
+    several :class:`_RecipientQuery` objects, fetched with a single
+    ``UNION ALL`` query
+
+    """
+    def __init__(self, queries, fetch_size=None):
+        self.queries = queries
+        self.fetch_size = fetch_size
+
+    def _sql(self, variant, vendor, joiner, ordering):
+        """Return my members' ``variant`` queries glued together with
+        ``joiner`` and followed by ``ordering``, compiling them only the first
+        time a union of this shape asks."""
+        def compile():
+            return joiner.join(q._sql(variant, vendor)
+                               for q in self.queries) + ordering
+        return recipient_query_cache.get(
+            ('union', variant, vendor) +
+            tuple(q.shape for q in self.queries),
+            compile)
+
+    def _params(self):
+        return [p for q in self.queries for p in q.params]
+
+    def __iter__(self):
+        connection = connections[router.db_for_read(Watch)]
+        query = self._sql('union_rows', connection.vendor, ' UNION ALL ',
+                          ' ORDER BY recipient_key DESC')
+        return _unique_by_email(
+            (u, [w]) for u, w, key in
+            multi_raw(query, self._params(), [get_user_model(), Watch],
+                      _model_to_fields(), fetch_size=self.fetch_size))
 
 
 class Event(object):
@@ -106,6 +471,77 @@ class Event(object):
     #: ``set(['color', 'flavor'])``
     filters = set()
 
+    #: If set, fire in shards of this many recipients, each sent by its own
+    #: Celery subtask, so a fire to a huge audience spreads across all the
+    #: workers rather than pinning one. The recipient query still runs once,
+    #: in the task that fires, which hands each shard the IDs of its users
+    #: and watches to fetch by primary key. ``None`` sends everything from a
+    #: single task.
+    shard_size = None
+
+    #: How many messages to hand the mail backend in each
+    #: ``send_messages()`` call during a fire
+    mail_batch_size = 100
+
+    #: How many mail backend connections to send a fire's mails over at once.
+    #: Above 1, :func:`tidings.delivery.send_concurrently()` delivers them,
+    #: one message per call, from a thread per connection.
+    mail_sessions = 1
+
+    #: If set, stream recipient rows from the DB this many at a time (through
+    #: a server-side cursor on PostgreSQL) instead of fetching them all before
+    #: the first mail is built
+    fetch_size = None
+
+    #: Whether to pick each recipient's best row in SQL, with window
+    #: functions, rather than in Python. Falls back to Python on backends
+    #: lacking the needed window functions.
+    dedupe_in_sql = False
+
+    #: How many watches :meth:`stop_notifying_all()` deletes per transaction.
+    #: :func:`~tidings.models.delete_watches()` splits each chunk into
+    #: statements small enough for the backend's limit on bound parameters.
+    delete_chunk_size = 1000
+
+    #: If set, cache the IDs of the recipients and watches
+    #: :meth:`_users_watching_by_filter()` finds, for this many seconds, in
+    #: :func:`~tidings.utils.tidings_cache()`, so repeated fires of an object
+    #: fetch them by primary key rather than running the full query again.
+    #: Needs :data:`~django.conf.settings.TIDINGS_CACHE_RECIPIENTS`, under
+    #: which saving or deleting a watch or a watch filter, or changing a
+    #: user's email, retires the cached lists it could affect, as do this
+    #: app's bulk operations. Other changes made behind the ORM's back, such
+    #: as with ``QuerySet.update()``, should be followed by a call to
+    #: :func:`~tidings.utils.invalidate_recipients()`.
+    recipient_cache_timeout = None
+
+    #: If True, :meth:`fire()` first checks, with one ``EXISTS`` query on
+    #: the index made for fires, whether anyone watches my event type and,
+    #: if there's one, content type and object, and does nothing more if
+    #: nobody does, sending no task and running no recipient query. See
+    #: :meth:`_anyone_watching()` and :data:`unwatched_fires`.
+    skip_unwatched = False
+
+    #: If True, delayed fires made inside a transaction are sent to Celery
+    #: only once it commits, so workers don't race it to read stale rows, and
+    #: identical ones made in the same transaction are sent just once
+    fire_on_commit = False
+
+    #: If set, coalesce delayed fires having the same :meth:`_coalesce_key()`
+    #: (by default, identical fires) within this many seconds of the first:
+    #: only one task runs, after the window, with the latest of them.
+    #: Meanwhile, the latest fire waits in
+    #: :func:`~tidings.utils.tidings_cache()`, so the cache must be shared
+    #: between web and worker processes.
+    coalesce_window = None
+
+    #: If set, collect fires into digests sent every this many seconds
+    #: instead of sending mail for each: :meth:`fire()` just records the
+    #: event, and :func:`~tidings.tasks.send_digests`, which you should run
+    #: periodically, sends each window's worth at once. See
+    #: :meth:`_digest_mails()`.
+    digest_window = None
+
     def fire(self, exclude=None, delay=True):
         """Notify everyone watching the event.
 
@@ -121,27 +557,276 @@ class Event(object):
           address may still be sent. A sequence of users may also be passed in.
 
         :arg delay: If True (default), the event is handled asynchronously with
-          Celery. This requires the pickle task serializer, which is no longer
-          the default starting in Celery 4.0. If False, the event is processed
-          immediately.
+          Celery. Unless :data:`~django.conf.settings.TIDINGS_TASK_SERIALIZER`
+          is ``'json'``, this requires the pickle task serializer, which is no
+          longer the default starting in Celery 4.0. If False, the event is
+          processed immediately. (If :attr:`shard_size` is set, the shards are
+          still dispatched as Celery tasks.)
+
+        If :attr:`skip_unwatched` is set and nobody is watching, do nothing.
+        If :attr:`digest_window` is set, just record the event for the next
+        digest, whatever ``delay`` is. If :attr:`fire_on_commit` is set and
+        ``delay`` is True, wait for any open transaction to commit.
         """
-        if delay:
-            # Tasks don't receive the `self` arg implicitly.
-            self._fire_task.apply_async(
-                args=(self,),
-                kwargs={'exclude': exclude},
-                serializer='pickle')
-        else:
+        if self.skip_unwatched:
+            unwatched_fires.checked += 1
+            if not self._anyone_watching():
+                unwatched_fires.skipped += 1
+                return
+        if self.digest_window:
+            self._queue_for_digest(exclude)
+        elif not delay:
             self._fire_task(self, exclude=exclude)
+        elif not (self.fire_on_commit and self._defer_to_commit(exclude)):
+            self._dispatch(exclude)
+
+    def _dispatch(self, exclude=None):
+        """Hand me to Celery to fire, coalescing me with other fires if
+        :attr:`coalesce_window` is set."""
+        if self.coalesce_window:
+            key = self._coalesce_key(exclude)
+            if key is not None:
+                self._coalesce(key, exclude)
+                return
+        self._task_signature('_fire_task', exclude=exclude).apply_async()
+
+    def _defer_to_commit(self, exclude=None):
+        """If a transaction is open on the DB watches are written to, arrange
+        to dispatch me once it commits, and return True. Otherwise, return
+        False.
+
+        If an identical fire--the same class, attributes, and ``exclude``,
+        comparing model instances by primary key--is already waiting on the
+        transaction, do nothing more. Fires wait on hooks registered with
+        ``transaction.on_commit()``, so ones made in a savepoint that's rolled
+        back are dropped along with it, as are all of them if the transaction
+        is.
+
+        """
+        using = router.db_for_write(Watch)
+        connection = connections[using]
+        if not connection.in_atomic_block:
+            # Any fires still listed belong to a rolled-back transaction:
+            connection.__dict__.pop('tidings_fires', None)
+            return False
+        key = self._identity(exclude)
+        if key is None:
+            key = id(self)  # Can't tell what's identical, so don't collapse.
+
+        # Forget fires whose hooks a rollback has discarded. Entries are
+        # (savepoint IDs, hook) pairs, with a third item as of Django 4.2:
+        live_hooks = set(id(entry[1]) for entry in connection.run_on_commit)
+        waiting = connection.__dict__.setdefault('tidings_fires', {})
+        for k in [k for k, hook in iteritems(waiting)
+                  if id(hook) not in live_hooks]:
+            del waiting[k]
+
+        if key not in waiting:
+            def hook():
+                waiting.pop(key, None)
+                self._dispatch(exclude)
+            waiting[key] = hook
+            transaction.on_commit(hook, using=using)
+        return True
+
+    def _identity(self, exclude=None):
+        """Return a string that's the same for identical fires--ones of my
+        class, with the same attributes and ``exclude``, comparing model
+        instances by primary key--or None if I can't be encoded to tell."""
+        try:
+            return json.dumps(encode([self, exclude]), sort_keys=True)
+        except TypeError:
+            return None
+
+    def _task_signature(self, name, *args, **kwargs):
+        """Return a Celery signature calling my task method ``name`` with
+        the given args.
+
+        Tasks don't receive the `self` arg implicitly, so I go along as the
+        first one: pickled whole by default or, if
+        :data:`~django.conf.settings.TIDINGS_TASK_SERIALIZER` is ``'json'``,
+        encoded by :func:`tidings.payload.encode()` for :func:`_event_task`
+        to rebuild. The JSON payload names model instances rather than
+        carrying them, so it is much smaller, and it needs only Celery's
+        default serializer.
+
+        """
+        if getattr(settings, 'TIDINGS_TASK_SERIALIZER', 'pickle') == 'json':
+            return _event_task.signature(
+                args=(name, encode([self, args, kwargs])), serializer='json')
+        return getattr(self, name).signature(
+            args=(self,) + args, kwargs=kwargs, serializer='pickle')
 
     @task
     def _fire_task(self, exclude=None):
-        """Build and send the emails as a celery task."""
+        """Build and send the emails as a celery task.
+
+        If :attr:`shard_size` is set and my recipients come straight from
+        :meth:`_users_watching_by_filter()` (or, for an :class:`EventUnion`,
+        all its events' do), run the query here, already deduplicated by
+        address, and send each :attr:`shard_size` recipients from a subtask
+        in a Celery group, passing it just their user and watch IDs.
+
+        """
+        users_and_watches = self._users_watching(exclude=exclude)
+        if not (self.shard_size and
+                isinstance(users_and_watches, (_RecipientQuery, _UnionQuery))):
+            self._send_mails(users_and_watches)
+            return
+
+        entries = _recipient_ids(users_and_watches)
+        if entries:
+            group(self._task_signature('_fire_shard_task', shard)
+                  for shard in chunked(entries, self.shard_size)).apply_async()
+
+    @task
+    def _fire_shard_task(self, entries):
+        """Send the emails to the recipients named by (user ID or None,
+        email, [watch IDs]) ``entries``, as one shard of a sharded fire."""
+        self._send_mails(_recipients_from_ids(entries, self.fetch_size))
+
+    def _coalesce_key(self, exclude=None):
+        """Return a string identifying the fires to coalesce with mine, made
+        with ``exclude``, if :attr:`coalesce_window` is set, or None to send
+        mine without coalescing.
+
+        By default, only identical fires are coalesced, so none that would
+        notify different people or say something different is dropped; fires
+        that can't be encoded to compare aren't coalesced at all. Override
+        this to coalesce more broadly--for example, to key on just an
+        instance when only the latest fire about it matters.
+
+        """
+        return self._identity(exclude)
+
+    def _coalesce(self, coalesce_key, exclude=None):
+        """Fire, with the latest event and ``exclude`` given, after
+        :attr:`coalesce_window`, unless such a fire is already pending for
+        ``coalesce_key``."""
+        cache = tidings_cache()
+        key = cache_key('coalesce', coalesce_key)
+        # Outlive the pending task even if it's a little late:
+        cache.set(key + ':latest', (self, exclude),
+                  self.coalesce_window * 2 + 60)
+        if cache.add(key, True, self.coalesce_window):
+            # The task finds the event in the cache, so the message is tiny
+            # and suits any serializer.
+            _fire_coalesced.apply_async(args=(key,),
+                                        countdown=self.coalesce_window)
+        else:
+            log.debug('%s: coalesced a fire into a pending one.',
+                      self.__class__.__name__)
+
+    def _queue_for_digest(self, exclude=None):
+        """Record me, and the users to exclude from my fire, for the next
+        digest."""
+        if exclude is None:
+            exclude = []
+        elif not isinstance(exclude, Sequence):
+            exclude = [exclude]
+        cls = self.__class__
+        PendingNotification.objects.create(
+            event_class='%s.%s' % (cls.__module__, cls.__name__),
+            payload=json.dumps(encode([self, [u.pk for u in exclude
+                                              if u.pk]])))
+
+    @classmethod
+    def _send_digest(cls, events_and_excludes):
+        """Send one window's digest of fired events.
+
+        :arg events_and_excludes: (event, IDs of users excluded from its
+          fire) pairs, in the order the events were fired
+
+        Events whose recipient queries are the same--say, several fires for
+        the same forum thread--share one run of it. Then each recipient's
+        events go together to one :meth:`_digest_mails()` call, and the mails
+        are sent over one connection. Return a (sent, failed) tuple.
+
+        """
+        events = [e for e, excluded in events_and_excludes]
+        if not events:
+            return 0, 0
+
+        # Run each distinct recipient query once:
+        queries = OrderedDict()
+        for i, (event, excluded) in enumerate(events_and_excludes):
+            query = event._users_watching()
+            key = ((query.shape, tuple(query.params))
+                   if isinstance(query, _RecipientQuery) else ('event', i))
+            queries.setdefault(key, (query, []))[1].append((i, excluded))
+
+        # Gather, for each recipient, their watches and the events they
+        # weren't excluded from:
+        recipients = OrderedDict()
+        for query, members in itervalues(queries):
+            for user, watches in query:
+                entry = recipients.setdefault(user.email.lower(),
+                                              (user, [], []))
+                entry[1].extend(watches)
+                entry[2].extend(i for i, excluded in members
+                                if getattr(user, 'pk', None) not in excluded)
+
+        # Recipients getting the same set of events can share a call:
+        by_events = OrderedDict()
+        for user, watches, indexes in itervalues(recipients):
+            if indexes:
+                by_events.setdefault(tuple(sorted(set(indexes))), []).append(
+                    (user, watches))
+
+        def mails():
+            for indexes, users_and_watches in iteritems(by_events):
+                digested = [events[i] for i in indexes]
+                for message in digested[0]._digest_mails(digested,
+                                                         users_and_watches):
+                    yield message
+        return events[0]._deliver(mails())
+
+    def _send_mails(self, users_and_watches):
+        """Build the emails for ``users_and_watches`` and send them in batches
+        of :attr:`mail_batch_size`.
+
+        Log the size, failure count, and time taken of each batch, and return
+        a (sent, failed) tuple of totals.
+
+        If :attr:`mail_sessions` is more than 1, send them concurrently over
+        that many connections instead, and log just the totals.
+
+        """
+        return self._deliver(self._mails(users_and_watches))
+
+    def _deliver(self, mails):
+        """Send the EmailMessages from the iterable ``mails`` as
+        :meth:`_send_mails()` describes."""
+        if self.mail_sessions > 1:
+            from .delivery import send_concurrently
+
+            start = time.time()
+            results = send_concurrently(mails, self.mail_sessions)
+            failed = sum(1 for recipients, error in results if error)
+            log.info('%s: sent %s of %s messages over %s sessions in %.3fs '
+                     '(%s failed)',
+                     self.__class__.__name__, len(results) - failed,
+                     len(results), self.mail_sessions, time.time() - start,
+                     failed)
+            return len(results) - failed, failed
+
         connection = mail.get_connection(fail_silently=True)
         # Warning: fail_silently swallows errors thrown by the generators, too.
         connection.open()
-        for m in self._mails(self._users_watching(exclude=exclude)):
-            connection.send_messages([m])
+        total_sent = total_failed = 0
+        try:
+            for batch in chunked(mails, self.mail_batch_size):
+                start = time.time()
+                sent = connection.send_messages(batch) or 0
+                failed = len(batch) - sent
+                log.info('%s: sent %s of %s messages in %.3fs (%s failed)',
+                         self.__class__.__name__, sent, len(batch),
+                         time.time() - start, failed)
+                total_sent += sent
+                total_failed += failed
+        finally:
+            connection.close()
+        return total_sent, total_failed
 
     @classmethod
     def _validate_filters(cls, filters):
@@ -198,88 +883,37 @@ class Event(object):
         elif not isinstance(exclude, Sequence):
             exclude = [exclude]
 
-        def filter_conditions():
-            """Return joins, WHERE conditions, and params to bind to them in
-            order to check a notification against all the given filters."""
-            # Not a one-liner. You're welcome. :-)
-            self._validate_filters(filters)
-            joins, wheres, join_params, where_params = [], [], [], []
-            for n, (k, v) in enumerate(iteritems(filters)):
-                joins.append(
-                    'LEFT JOIN tidings_watchfilter f{n} '
-                    'ON f{n}.watch_id=w.id '
-                    'AND f{n}.name=%s'.format(n=n))
-                join_params.append(k)
-                wheres.append('(f{n}.value=%s '
-                              'OR f{n}.value IS NULL)'.format(n=n))
-                where_params.append(hash_to_unsigned(v))
-            return joins, wheres, join_params + where_params
-
-        # Apply watchfilter constraints:
-        joins, wheres, params = filter_conditions()
+        self._validate_filters(filters)
+        if exclude:
+            # Don't try excluding unsaved Users:1
+            if not all(e.id for e in exclude):
+                raise ValueError("Can't exclude an unsaved User.")
 
-        # Start off with event_type, which is always a constraint. These go in
-        # the `wheres` list to guarantee that the AND after the {wheres}
-        # substitution in the query is okay.
-        wheres.append('w.event_type=%s')
+        # Bind params in the order the compiled query expects them: filter
+        # names for the joins, then filter values, event_type, content_type,
+        # object_id, and excluded users for the WHERE clause.
+        filter_names = sorted(filters)
+        params = list(filter_names)
+        params.extend(hash_to_unsigned(filters[k]) for k in filter_names)
         params.append(self.event_type)
-
-        # Constrain on other 1-to-1 attributes:
         if self.content_type:
-            wheres.append('(w.content_type_id IS NULL '
-                          'OR w.content_type_id=%s)')
             params.append(ContentType.objects.get_for_model(
                           self.content_type).id)
         if object_id:
-            wheres.append('(w.object_id IS NULL OR w.object_id=%s)')
             params.append(object_id)
-        if exclude:
-            # Don't try excluding unsaved Users:1
-            if not all(e.id for e in exclude):
-                raise ValueError("Can't exclude an unsaved User.")
+        params.extend(e.id for e in exclude)
 
-            wheres.append('(u.id IS NULL OR u.id NOT IN (%s))' %
-                          ', '.join('%s' for e in exclude))
-            params.extend(e.id for e in exclude)
+        if self.recipient_cache_timeout and not recipient_cache_enabled():
+            raise ImproperlyConfigured(
+                '%s.recipient_cache_timeout needs TIDINGS_CACHE_RECIPIENTS.' %
+                self.__class__.__name__)
 
-        def get_fields(model):
-            if hasattr(model._meta, '_fields'):
-                # For django versions < 1.6
-                return model._meta._fields()
-            else:
-                # For django versions >= 1.6
-                return model._meta.fields
-
-        User = get_user_model()
-        model_to_fields = dict((m, [f.get_attname() for f in get_fields(m)])
-                               for m in [User, Watch])
-        query_fields = [
-            'u.{0}'.format(field) for field in model_to_fields[User]]
-        query_fields.extend([
-            'w.{0}'.format(field) for field in model_to_fields[Watch]])
-
-        query = (
-            'SELECT {fields} '
-            'FROM tidings_watch w '
-            'LEFT JOIN {user_table} u ON u.id=w.user_id {joins} '
-            'WHERE {wheres} '
-            'AND (length(w.email)>0 OR length(u.email)>0) '
-            'AND w.is_active '
-            'ORDER BY u.email DESC, w.email DESC').format(
-            fields=', '.join(query_fields),
-            joins=' '.join(joins),
-            wheres=' AND '.join(wheres),
-            user_table=User._meta.db_table)
-        # IIRC, the DESC ordering was something to do with the placement of
-        # NULLs. Track this down and explain it.
-
-        # Put watch in a list just for consistency. Once the pairs go through
-        # _unique_by_email, watches will be in a list, and EventUnion uses the
-        # same function to union already-list-enclosed pairs from individual
-        # events.
-        return _unique_by_email((u, [w]) for u, w in
-                                multi_raw(query, params, [User, Watch],
-                                          model_to_fields))
+        shape = (self.__class__, tuple(filter_names), bool(self.content_type),
+                 bool(object_id), len(exclude))
+        return _RecipientQuery(shape, params,
+                               fetch_size=self.fetch_size,
+                               dedupe_in_sql=self.dedupe_in_sql,
+                               cache_timeout=self.recipient_cache_timeout)
 
     @classmethod
     def _watches_belonging_to_user(cls, user_or_email, object_id=None,
@@ -301,8 +935,6 @@ class Event(object):
         If you pass the AnonymousUser, this will return an empty QuerySet.
 
         """
-        # If we have trouble distinguishing subsets and such, we could store a
-        # number_of_filters on the Watch.
         cls._validate_filters(filters)
 
         if isinstance(user_or_email, string_types):
@@ -311,20 +943,24 @@ class Event(object):
             user_condition = Q(user=user_or_email)
         else:
             return Watch.objects.none()
+        return cls._watches_matching(user_condition, object_id, filters)
 
+    @classmethod
+    def _watches_matching(cls, user_condition, object_id, filters,
+                          exact=True):
+        """Return a QuerySet of watches meeting the Q object
+        ``user_condition``, having the given dict of (already validated)
+        ``filters``--and, if ``exact``, no others--and having the event_type
+        and content_type attrs of the class."""
         # Filter by stuff in the Watch row:
         watches = getattr(Watch, 'uncached', Watch.objects).filter(
             user_condition,
             Q(content_type=ContentType.objects.get_for_model(
                 cls.content_type)) if cls.content_type else Q(),
             Q(object_id=object_id) if object_id else Q(),
-            event_type=cls.event_type).extra(
-                where=['(SELECT count(*) FROM tidings_watchfilter WHERE '
-                       'tidings_watchfilter.watch_id='
-                       'tidings_watch.id)=%s'],
-                params=[len(filters)])
-        # Optimization: If the subselect ends up being slow, store the number
-        # of filters in each Watch row or try a GROUP BY.
+            # Rule out watches with more filters than we're matching:
+            Q(filter_count=len(filters)) if exact else Q(),
+            event_type=cls.event_type)
 
         # Apply 1-to-many filters:
         for k, v in iteritems(filters):
@@ -359,6 +995,22 @@ class Event(object):
                                               object_id=object_id,
                                               **filters).exists()
 
+    @classmethod
+    def is_notifying_many(cls, user_or_email_, instances_or_object_ids,
+                          **filters):
+        """Return the set of object IDs, out of the given ones, whose events
+        the user/email is watching (either active or inactive watches), with
+        exactly the given ``filters``.
+
+        This answers :meth:`is_notifying()` for a whole list of objects with
+        one query. Model instances may be passed in place of their IDs.
+
+        """
+        object_ids = set(getattr(i, 'pk', i) for i in instances_or_object_ids)
+        watches = cls._watches_belonging_to_user(user_or_email_, **filters)
+        return set(watches.filter(object_id__in=object_ids)
+                   .values_list('object_id', flat=True))
+
     @classmethod
     def notify(cls, user_or_email_, object_id=None, **filters):
         """Start notifying the given user or email address when this event
@@ -393,27 +1045,16 @@ class Event(object):
             if cls.content_type:
                 create_kwargs['content_type'] = \
                     ContentType.objects.get_for_model(cls.content_type)
-            create_kwargs['email' if isinstance(user_or_email_, string_types)
-                          else 'user'] = user_or_email_
-            # Letters that can't be mistaken for other letters or numbers in
-            # most fonts, in case people try to type these:
-            distinguishable_letters = \
-                'abcdefghjkmnpqrstuvwxyzABCDEFGHJKLMNPQRTUVWXYZ'
-            secret = ''.join(random.choice(distinguishable_letters)
-                             for x in range(10))
-            # Registered users don't need to confirm, but anonymous users do.
-            is_active = ('user' in create_kwargs or
-                         not settings.TIDINGS_CONFIRM_ANONYMOUS_WATCHES)
             if object_id:
                 create_kwargs['object_id'] = object_id
-            watch = Watch.objects.create(
-                secret=secret,
-                is_active=is_active,
-                event_type=cls.event_type,
-                **create_kwargs)
-            for k, v in iteritems(filters):
-                WatchFilter.objects.create(watch=watch, name=k,
-                                           value=hash_to_unsigned(v))
+            watch = cls._new_watch(user_or_email_, filters, **create_kwargs)
+            watch.save()
+            WatchFilter.objects.bulk_create(
+                WatchFilter(watch=watch, name=k, value=hash_to_unsigned(v))
+                for k, v in iteritems(filters))
+            if filters:
+                # The watch's post_save came before its filters existed.
+                invalidate_recipients(cls.event_type)
         # Send email for inactive watches.
         if not watch.is_active:
             email = watch.user.email if watch.user else watch.email
@@ -425,6 +1066,116 @@ class Event(object):
                 raise ActivationRequestFailed(e.recipients)
         return watch
 
+    @classmethod
+    def _new_watch(cls, user_or_email, filters, **kwargs):
+        """Return a new, unsaved watch of my event_type for a user or email
+        address, to have the given filters."""
+        kwargs['email' if isinstance(user_or_email, string_types)
+               else 'user'] = user_or_email
+        # Letters that can't be mistaken for other letters or numbers in
+        # most fonts, in case people try to type these:
+        distinguishable_letters = \
+            'abcdefghjkmnpqrstuvwxyzABCDEFGHJKLMNPQRTUVWXYZ'
+        secret = ''.join(random.choice(distinguishable_letters)
+                         for x in range(10))
+        # Registered users don't need to confirm, but anonymous users do.
+        is_active = ('user' in kwargs or
+                     not settings.TIDINGS_CONFIRM_ANONYMOUS_WATCHES)
+        return Watch(secret=secret,
+                     is_active=is_active,
+                     event_type=cls.event_type,
+                     filter_count=len(filters),
+                     **kwargs)
+
+    @classmethod
+    def notify_many(cls, users_and_emails, object_id=None, **filters):
+        """Start notifying each of the given users or email addresses when
+        this event occurs and meets the criteria given in ``filters``.
+
+        This is the bulk version of :meth:`notify()`. It finds the existing
+        matching watches with one query and creates the missing ones, and
+        their filters, with ``bulk_create()``, so subscribing thousands of
+        users takes a handful of queries rather than several per user.
+
+        Return a list of the created (or existing matching) watches, one per
+        distinct user or email address, in the order given. AnonymousUsers
+        are skipped.
+
+        Rather than being sent inline, activation emails for inactive watches
+        all go to a single :func:`~tidings.tasks.send_activation_emails` task,
+        queued once the transaction commits, which deletes any watch whose
+        email can't be sent. Nothing is raised to the caller, so this needs
+        an Event subclass importable by its dotted path.
+
+        """
+        cls._validate_filters(filters)
+
+        def key(user_or_email):
+            return (user_or_email if isinstance(user_or_email, string_types)
+                    else user_or_email.pk)
+
+        wanted = OrderedDict()
+        for user_or_email in users_and_emails:
+            if (isinstance(user_or_email, string_types) or
+                    user_or_email.is_authenticated):
+                wanted.setdefault(key(user_or_email), user_or_email)
+        if not wanted:
+            return []
+        user_ids = set(k for k in wanted if not isinstance(k, string_types))
+
+        # Pick 1 per user or email if >1 match. Look them up a batch at a
+        # time to stay within the backend's limit on bound parameters:
+        watches = {}
+        batch_size = connections[router.db_for_read(Watch)].ops\
+            .bulk_batch_size(['pk'], wanted)
+        for batch in chunked(wanted, batch_size):
+            batch_emails = [k for k in batch if isinstance(k, string_types)]
+            batch_user_ids = [k for k in batch if k in user_ids]
+            for watch in cls._watches_matching(
+                    Q(email__in=batch_emails) | Q(user__in=batch_user_ids),
+                    object_id, filters):
+                watches.setdefault(watch.user_id if watch.user_id in user_ids
+                                   else watch.email, watch)
+
+        create_kwargs = {}
+        if cls.content_type:
+            create_kwargs['content_type'] = \
+                ContentType.objects.get_for_model(cls.content_type)
+        if object_id:
+            create_kwargs['object_id'] = object_id
+        created = Watch.objects.bulk_create(
+            cls._new_watch(user_or_email, filters, **create_kwargs)
+            for k, user_or_email in iteritems(wanted) if k not in watches)
+        if created and created[0].pk is None:
+            # The backend can't tell us the IDs of bulk-inserted rows, so
+            # find them again by their secrets.
+            by_secret = {}
+            for secrets in chunked([w.secret for w in created], 500):
+                for watch in Watch.objects.filter(event_type=cls.event_type,
+                                                  secret__in=secrets):
+                    by_secret[watch.secret, watch.user_id,
+                              watch.email] = watch
+            created = [by_secret[w.secret, w.user_id, w.email]
+                       for w in created]
+        values = [(k, hash_to_unsigned(v)) for k, v in iteritems(filters)]
+        WatchFilter.objects.bulk_create(
+            WatchFilter(watch=watch, name=k, value=v)
+            for watch in created for k, v in values)
+        if created:
+            invalidate_recipients(cls.event_type)
+        for watch in created:
+            watches[watch.user_id or watch.email] = watch
+
+        result = [watches[k] for k in wanted]
+        inactive = [w.pk for w in result if not w.is_active]
+        if inactive:
+            # Don't let the task look for watches before they're committed:
+            path = '%s.%s' % (cls.__module__, cls.__name__)
+            transaction.on_commit(
+                lambda: send_activation_emails.delay(path, inactive),
+                using=router.db_for_write(Watch))
+        return result
+
     @classmethod
     def stop_notifying(cls, user_or_email_, **filters):
         """Delete all watches matching the exact user/email and filters.
@@ -438,14 +1189,31 @@ class Event(object):
         """
         cls._watches_belonging_to_user(user_or_email_, **filters).delete()
 
-    # TODO: If GenericForeignKeys don't give us cascading deletes, make a
-    # stop_notifying_all(**filters) or something. It should delete any watch of
-    # the class's event_type and content_type and having filters matching each
-    # of **filters. Even if there are additional filters on a watch, that watch
-    # should still be deleted so we can delete, for example, any watch that
-    # references a certain Question instance. To do that, factor such that you
-    # can effectively call _watches_belonging_to_user() without it calling
-    # extra().
+    @classmethod
+    def stop_notifying_all(cls, object_id=None, **filters):
+        """Delete every watch of my event_type and content_type having the
+        given object ID and filters, whoever it belongs to.
+
+        Unlike :meth:`stop_notifying()`, delete watches having additional
+        filters too, so you can delete, for example, any watch that
+        references a certain Question instance. Return how many watches were
+        deleted.
+
+        Delete with set-based SQL, :attr:`delete_chunk_size` watches per
+        transaction, to bound how long rows stay locked. This skips the ORM's
+        collector and so sends no delete signals.
+
+        """
+        cls._validate_filters(filters)
+        watches = cls._watches_matching(Q(), object_id, filters, exact=False)
+        using = router.db_for_write(Watch)
+        deleted = 0
+        while True:
+            ids = list(watches.using(using).order_by()
+                       .values_list('id', flat=True)[:cls.delete_chunk_size])
+            if not ids:
+                return deleted
+            deleted += delete_watches(ids, using=using)
 
     # Subclasses should implement the following:
 
@@ -478,6 +1246,54 @@ class Event(object):
         """
         return self._users_watching_by_filter(**kwargs)
 
+    def _anyone_watching(self):
+        """Return False if nobody can be watching me, True if somebody
+        might be.
+
+        Default implementation looks for active watches of my event_type
+        and, if defined, content_type. Override it along with
+        :meth:`_users_watching()` if that looks at anything else but filters.
+
+        """
+        return self._possible_watches().exists()
+
+    def _possible_watches(self, object_id=None):
+        """Return a QuerySet of the active watches of my event_type and, if
+        defined, content_type, and of ``object_id`` if it's given: those a
+        fire of me might match, whatever their filters.
+
+        Each alternative is spelled out in full, rather than ORing NULL with
+        each value, so every one is a lookup on the ``tidings_watch_fire_idx``
+        index.
+
+        """
+        terms = [Q()]
+        if self.content_type:
+            content_type = ContentType.objects.get_for_model(
+                self.content_type)
+            terms = [Q(content_type=None), Q(content_type=content_type)]
+        if object_id:
+            terms = [t & o for t in terms
+                     for o in [Q(object_id=None), Q(object_id=object_id)]]
+        return Watch.objects.filter(
+            reduce(or_, (Q(event_type=self.event_type, is_active=True) & t
+                         for t in terms)))
+
+    def _digest_mails(self, events, users_and_watches):
+        """Return an iterable yielding an EmailMessage to send to each user,
+        telling them about several fires of a digest-mode event at once.
+
+        :arg events: the fired events, oldest first, of which I am the first
+        :arg users_and_watches: (User or EmailUser, [Watches]) pairs, as
+          :meth:`_mails()` takes, of recipients of all of ``events``
+
+        Override this to combine the events into one mail per recipient. The
+        default sends just the latest event's :meth:`_mails()`, so each
+        recipient still gets only one mail per window.
+
+        """
+        return events[-1]._mails(users_and_watches)
+
     @classmethod
     def _activation_email(cls, watch, email):
         """Return an EmailMessage to send to anonymous watchers.
@@ -548,14 +1364,30 @@ class EventUnion(Event):
         """
         return self.events[0]._mails(users_and_watches)
 
+    def _anyone_watching(self):
+        """Return whether anyone might be watching any of my events."""
+        return any(e._anyone_watching() for e in self.events)
+
     def _users_watching(self, **kwargs):
+        """Return the users watching any of my events.
+
+        If all my events get their watchers straight from
+        :meth:`~tidings.events.Event._users_watching_by_filter()`, fetch
+        them all in one ``UNION ALL`` query. Otherwise, merge each event's
+        watchers in Python.
+
+        """
+        users_and_watches = [e._users_watching(**kwargs) for e in self.events]
+        if all(isinstance(uw, _RecipientQuery) for uw in users_and_watches):
+            return _UnionQuery(users_and_watches, fetch_size=self.fetch_size)
+
         # Get a sorted iterable of user-watches pairs:
         def email_key(pair):
             user, watch = pair
             return user.email.lower()
 
         users_and_watches = collate(
-            *[e._users_watching(**kwargs) for e in self.events],
+            *users_and_watches,
             key=email_key,
             reverse=True)
 
@@ -597,7 +1429,71 @@ class InstanceEvent(Event):
         return super(InstanceEvent, cls).is_notifying(user_or_email,
                                                       object_id=instance.pk)
 
+    @classmethod
+    def mark_notifying(cls, user_or_email, instances, attr='is_notifying'):
+        """Set an attribute, named ``attr``, on each of the given instances
+        to whether the user/email is watching it, and return the instances
+        as a list.
+
+        This takes a single query, so it suits list views showing a "watch"
+        toggle per row::
+
+            objects = MyInstanceEvent.mark_notifying(request.user, page)
+
+        and then, in the template, ``{% if object.is_notifying %}``.
+
+        """
+        instances = list(instances)
+        watched = cls.is_notifying_many(user_or_email, instances)
+        for instance in instances:
+            setattr(instance, attr, instance.pk in watched)
+        return instances
+
+    def _anyone_watching(self):
+        """Look for active watches of this instance, or of all instances."""
+        return self._possible_watches(object_id=self.instance.pk).exists()
+
     def _users_watching(self, **kwargs):
         """Return users watching this instance."""
         return self._users_watching_by_filter(object_id=self.instance.pk,
                                               **kwargs)
+
+
+@task
+def _event_task(name, payload):
+    """Rebuild an event and the args sent along with it from a JSON payload
+    made by :meth:`Event._task_signature()`, and run its task method
+    ``name``.
+
+    If a model instance the event referred to has been deleted since it was
+    fired, log that and drop the fire.
+
+    """
+    try:
+        event, args, kwargs = decode(payload)
+    except ObjectDoesNotExist as exc:
+        log.warning('Dropping %s of a fired event: %s', name, exc)
+        return
+    getattr(event, name)(event, *args, **kwargs)
+
+
+@task
+def _fire_coalesced(key):
+    """Fire the latest event coalesced under ``key`` by
+    :meth:`Event._coalesce()`.
+
+    The pending marker is cleared before the event is read, so a fire made
+    meanwhile starts a new window rather than joining one whose event has
+    already been read; it may then be sent twice. Coalescing is only as
+    reliable as the cache, though: a marker that outlives this task, or an
+    event evicted before it runs, can still cost a fire.
+
+    """
+    cache = tidings_cache()
+    cache.delete(key)
+    latest = cache.get(key + ':latest')
+    if latest is None:
+        log.warning('A coalesced fire expired before it could be sent.')
+        return
+    event, exclude = latest
+    event._fire_task(event, exclude=exclude)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models, transaction
+from django.db.models import Count
+
+
+def count_filters(apps, schema_editor):
+    """Fill in filter_count a chunk of watches at a time, committing each
+    chunk so no more than one chunk's rows are locked, or counted in memory,
+    at once."""
+    Watch = apps.get_model('tidings', 'Watch')
+    WatchFilter = apps.get_model('tidings', 'WatchFilter')
+    db = schema_editor.connection.alias
+    last_id = 0
+    while True:
+        watch_ids = list(Watch.objects.using(db).filter(pk__gt=last_id)
+                         .order_by('pk').values_list('pk', flat=True)[:500])
+        if not watch_ids:
+            break
+        last_id = watch_ids[-1]
+        watch_ids_by_count = {}
+        for watch_id, count in (WatchFilter.objects.using(db)
+                                .filter(watch_id__in=watch_ids).order_by()
+                                .values('watch_id').annotate(count=Count('id'))
+                                .values_list('watch_id', 'count')):
+            watch_ids_by_count.setdefault(count, []).append(watch_id)
+        with transaction.atomic(using=db):
+            for count, ids in watch_ids_by_count.items():
+                Watch.objects.using(db).filter(pk__in=ids).update(
+                    filter_count=count)
+
+
+class Migration(migrations.Migration):
+
+    # Let count_filters() commit as it goes:
+    atomic = False
+
+    dependencies = [
+        ('tidings', '0002_update_email_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watch',
+            name='filter_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_filters, migrations.RunPython.noop),
+    ]
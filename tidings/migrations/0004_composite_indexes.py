@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """AddIndex that doesn't lock the table against writes on PostgreSQL
+
+    Elsewhere it's a plain AddIndex. Migrations using it can't be atomic.
+
+    """
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super(AddIndexConcurrently, self).database_forwards(
+                app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = str(self.index.create_sql(model, schema_editor))
+            schema_editor.execute(
+                sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1),
+                params=None)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super(AddIndexConcurrently, self).database_backwards(
+                app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS %s' %
+                schema_editor.quote_name(self.index.name),
+                params=None)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('tidings', '0003_watch_filter_count'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='watch',
+            index=models.Index(fields=['event_type', 'content_type',
+                                       'object_id', 'is_active'],
+                               name='tidings_watch_fire_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='watch',
+            index=models.Index(fields=['user', 'event_type'],
+                               name='tidings_watch_user_type_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='watchfilter',
+            index=models.Index(fields=['watch', 'name', 'value'],
+                               name='tidings_watchfilter_match_idx'),
+        ),
+    ]
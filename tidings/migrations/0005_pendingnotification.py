@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tidings', '0004_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('event_class', models.CharField(db_index=True,
+                                                 max_length=255)),
+                ('payload', models.TextField()),
+                ('created', models.DateTimeField(
+                    db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+INDEX = 'tidings_watch_email_lower_idx'
+
+
+def create_index(apps, schema_editor):
+    """Index lower(email), so claim_watches_bulk's case-insensitive matches
+    don't scan the whole table. Only PostgreSQL and SQLite, of the bundled
+    backends, can index an expression in every version Django supports."""
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    Watch = apps.get_model('tidings', 'Watch')
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        'CREATE INDEX %s%s ON %s (lower(%s))' % (
+            'CONCURRENTLY ' if connection.vendor == 'postgresql' else '',
+            quote(INDEX),
+            quote(Watch._meta.db_table),
+            quote(Watch._meta.get_field('email').column)),
+        params=None)
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    schema_editor.execute(
+        'DROP INDEX %sIF EXISTS %s' % (
+            'CONCURRENTLY ' if connection.vendor == 'postgresql' else '',
+            schema_editor.quote_name(INDEX)),
+        params=None)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('tidings', '0005_pendingnotification'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -4,16 +4,24 @@ from django.contrib.contenttypes.fields import (GenericForeignKey,
                                                 GenericRelation)
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
-from django.db import models, connections, router
+from django.core import signing
+from django.core.signals import setting_changed
+from django.db import models, connections, router, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-from .compat import next, text_type
-from .utils import import_from_setting, reverse
+from .compat import text_type
+from .utils import (chunked, import_from_setting, invalidate_recipients,
+                    recipient_cache_enabled, reverse)
 
 
 ModelBase = import_from_setting('TIDINGS_MODEL_BASE', models.Model)
 
 
-def multi_raw(query, params, models, model_to_fields):
+def multi_raw(query, params, models, model_to_fields,
+              fetch_size=None):
     """Scoop multiple model instances out of the DB at once, given a query that
     returns all fields of each.
 
@@ -22,16 +30,70 @@ def multi_raw(query, params, models, model_to_fields):
 
         [(<User such-and-such>, <Watch such-and-such>), ...]
 
+    Any columns after those of the models are appended to each sequence
+    as-is.
+
+    If ``fetch_size`` is given, stream the rows ``fetch_size`` at a time
+    rather than fetching them all up front, using a server-side cursor where
+    the DB supports one (PostgreSQL, unless ``DISABLE_SERVER_SIDE_CURSORS`` is
+    set). Memory use then stays flat however many rows there are.
+
     """
-    cursor = connections[router.db_for_read(models[0])].cursor()
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    connection = connections[router.db_for_read(models[0])]
+    hydrate = _row_hydrator(models, model_to_fields, connection.alias)
+    if fetch_size:
+        cursor = connection.chunked_cursor()
+    else:
+        cursor = connection.cursor()
+    try:
+        cursor.execute(query, params)
+        if fetch_size:
+            rows = _fetch_in_chunks(cursor, fetch_size)
+        else:
+            rows = cursor.fetchall()
+
+        for row in rows:
+            yield hydrate(row)
+    finally:
+        cursor.close()
+
+
+def _row_hydrator(models, model_to_fields, db):
+    """Return a function that turns a row laid out as for :func:`multi_raw`
+    into a list of model instances.
+
+    Each model's slice of the row is worked out once, up front, and handed
+    positionally to ``Model.from_db()``, so no per-row dicts or kwargs are
+    built.
 
-    for row in rows:
-        row_iter = iter(row)
-        yield [model_class(**dict((a, next(row_iter))
-                           for a in model_to_fields[model_class]))
-               for model_class in models]
+    """
+    slices = []
+    start = 0
+    for model_class in models:
+        field_names = model_to_fields[model_class]
+        slices.append((model_class.from_db, field_names,
+                       start, start + len(field_names)))
+        start += len(field_names)
+    width = start
+
+    def hydrate(row):
+        instances = [from_db(db, field_names, row[start:stop])
+                     for from_db, field_names, start, stop in slices]
+        if len(row) > width:
+            instances.extend(row[width:])
+        return instances
+    return hydrate
+
+
+def _fetch_in_chunks(cursor, size):
+    """Yield the rows of an executed ``cursor``, calling ``fetchmany(size)``
+    as needed."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        for row in rows:
+            yield row
 
 
 class Watch(ModelBase):
@@ -63,6 +125,23 @@ class Watch(ModelBase):
     #: Active watches receive notifications, inactive watches don't.
     is_active = models.BooleanField(default=False, db_index=True)
 
+    #: How many :class:`WatchFilters <WatchFilter>` I have, so telling a watch
+    #: from ones with more filters doesn't take a subquery per watch. Saving
+    #: or deleting a single :class:`WatchFilter` keeps it up to date; bulk
+    #: operations on them don't.
+    filter_count = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta(object):
+        indexes = [
+            # For finding the watches to fire:
+            models.Index(fields=['event_type', 'content_type', 'object_id',
+                                 'is_active'],
+                         name='tidings_watch_fire_idx'),
+            # For is_notifying() and friends, given a registered user:
+            models.Index(fields=['user', 'event_type'],
+                         name='tidings_watch_user_type_idx'),
+        ]
+
     def __unicode__(self):
         # TODO: Trace event_type back to find the Event subclass, and ask it
         # how to describe me in English.
@@ -81,12 +160,12 @@ class Watch(ModelBase):
         return self
 
     def unsubscribe_url(self):
-        """Return the absolute URL to visit to delete me."""
-        server_relative = ('%s?s=%s' % (reverse('tidings.unsubscribe',
-                                                args=[self.pk]),
-                                        self.secret))
-        return 'https://%s%s' % (Site.objects.get_current().domain,
-                                 server_relative)
+        """Return the absolute URL to visit to delete me.
+
+        To build this for many watches, use one :class:`URLBuilder` instead.
+
+        """
+        return URLBuilder().unsubscribe_url(self)
 
 
 class WatchFilter(ModelBase):
@@ -109,10 +188,267 @@ class WatchFilter(ModelBase):
         #
         # This ordering makes the index usable for lookups by name.
         unique_together = ('name', 'watch')
+        indexes = [
+            # For matching filters against a fire's, watch by watch:
+            models.Index(fields=['watch', 'name', 'value'],
+                         name='tidings_watchfilter_match_idx'),
+        ]
 
     def __unicode__(self):
         return u'WatchFilter %s: %s=%s' % (self.pk, self.name, self.value)
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(WatchFilter, self).save(*args, **kwargs)
+        if adding:
+            self._count_on_watch(1)
+
+    def delete(self, *args, **kwargs):
+        result = super(WatchFilter, self).delete(*args, **kwargs)
+        self._count_on_watch(-1)
+        return result
+
+    def _count_on_watch(self, delta):
+        """Add ``delta`` to my watch's :attr:`~Watch.filter_count`, in the DB
+        and on the watch instance I hold, if any."""
+        Watch.objects.filter(pk=self.watch_id).update(
+            filter_count=models.F('filter_count') + delta)
+        if self._watch_is_cached():
+            self.watch.filter_count += delta
+
+    def _watch_is_cached(self):
+        """Return whether I hold my watch, so using it costs no query."""
+        field = self._meta.get_field('watch')
+        return (field.is_cached(self) if hasattr(field, 'is_cached')  # 2.0+
+                else hasattr(self, field.get_cache_name()))
+
+
+class PendingNotification(ModelBase):
+    """A fire of a digest-mode :class:`~tidings.events.Event`, waiting to be
+    sent with the others of its window by
+    :func:`~tidings.tasks.send_digests`"""
+
+    #: Dotted path of the Event subclass
+    event_class = models.CharField(max_length=255, db_index=True)
+
+    #: The event and the IDs of the users excluded from its fire, as JSON
+    #: made by :func:`tidings.payload.encode()`
+    payload = models.TextField()
+
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __unicode__(self):
+        return u'PendingNotification %s: %s at %s' % (self.pk,
+                                                      self.event_class,
+                                                      self.created)
+
+
+#: Salt for the signed tokens of one-click unsubscribe URLs
+UNSUBSCRIBE_SALT = 'tidings.unsubscribe'
+
+#: The template context key under which
+#: :func:`~tidings.utils.emails_with_users_and_watches` passes a fire's
+#: :class:`URLBuilder`
+URL_BUILDER = 'tidings_urls'
+
+
+class URLBuilder(object):
+    """Builder of tidings' absolute URLs for many watches
+
+    It looks up the current site and reverses each URL pattern only the first
+    time it needs them, so building a URL for each of a fire's watches costs
+    just some string formatting. Make one per fire, as
+    :func:`~tidings.utils.emails_with_users_and_watches` does: the site and
+    URLconf are assumed not to change in the meantime.
+
+    """
+    # Stand-ins for the variable parts of URLs, to split reversed ones on:
+    _ID_PLACEHOLDER = '9876543210'
+    _TOKEN_PLACEHOLDER = 'tidings-token'
+
+    def __init__(self):
+        self._prefixes = {}
+
+    @cached_property
+    def domain(self):
+        """The domain of the current Site"""
+        return Site.objects.get_current().domain
+
+    def _url(self, view_name, placeholder, arg):
+        """Return the absolute URL of ``view_name`` with the single arg
+        ``arg``."""
+        try:
+            before, after = self._prefixes[view_name]
+        except KeyError:
+            url = 'https://%s%s' % (self.domain,
+                                    reverse(view_name, args=[placeholder]))
+            before, after = self._prefixes[view_name] = \
+                url.rsplit(placeholder, 1)
+        return '%s%s%s' % (before, arg, after)
+
+    def unsubscribe_url(self, watch):
+        """Return the absolute URL to visit to delete ``watch``."""
+        return '%s?s=%s' % (self._url('tidings.unsubscribe',
+                                      self._ID_PLACEHOLDER, watch.pk),
+                            watch.secret)
+
+    def one_click_unsubscribe_url(self, watches=None, email=None):
+        """Return the absolute URL to POST to in order to delete the given
+        watches or, if an ``email`` is given instead, every watch belonging
+        to that address, as :rfc:`8058` one-click unsubscription calls for.
+
+        The URL carries a signed token naming what to delete, so
+        :func:`~tidings.views.one_click_unsubscribe` needn't look anything
+        up to check it.
+
+        """
+        target = [w.pk for w in watches] if email is None else email
+        return self._url('tidings.one_click_unsubscribe',
+                         self._TOKEN_PLACEHOLDER,
+                         signing.dumps(target, salt=UNSUBSCRIBE_SALT))
+
+    def list_unsubscribe_headers(self, watches=None, email=None):
+        """Return a dict of the ``List-Unsubscribe`` and
+        ``List-Unsubscribe-Post`` headers offering one-click unsubscription
+        from the given watches or email address, as
+        :meth:`one_click_unsubscribe_url()` takes them."""
+        return {'List-Unsubscribe': '<%s>' % self.one_click_unsubscribe_url(
+                    watches=watches, email=email),
+                'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click'}
+
+
+def one_click_unsubscribe_url(watches=None, email=None):
+    """Shortcut for :meth:`URLBuilder.one_click_unsubscribe_url()`"""
+    return URLBuilder().one_click_unsubscribe_url(watches=watches,
+                                                  email=email)
+
+
+def list_unsubscribe_headers(watches=None, email=None):
+    """Shortcut for :meth:`URLBuilder.list_unsubscribe_headers()`"""
+    return URLBuilder().list_unsubscribe_headers(watches=watches,
+                                                 email=email)
+
+
+def delete_watches(ids, using=None):
+    """Delete the watches having the given IDs, and their filters, in one
+    transaction. Return how many watches were deleted.
+
+    This issues two set-based DELETEs--filters first, then watches--rather
+    than going through the ORM's collector, which loads every row to be
+    cascaded into memory first. No signals are sent, but if
+    :data:`~django.conf.settings.TIDINGS_CACHE_RECIPIENTS` is on, the cached
+    recipient lists of the watches' event types are invalidated.
+
+    """
+    if not ids:
+        return 0
+    using = using or router.db_for_write(Watch)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    deleted = 0
+    event_types = set()
+    # Keep each statement within the backend's limit on bound parameters:
+    batch_size = connection.ops.bulk_batch_size(['pk'], ids)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for batch in chunked(ids, batch_size):
+            placeholders = ', '.join(['%s'] * len(batch))
+            if recipient_cache_enabled():
+                cursor.execute('SELECT DISTINCT %s FROM %s WHERE %s IN (%s)' %
+                               (quote(Watch._meta.get_field('event_type')
+                                      .column),
+                                quote(Watch._meta.db_table),
+                                quote(Watch._meta.pk.column),
+                                placeholders),
+                               batch)
+                event_types.update(t for t, in cursor.fetchall())
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)' %
+                           (quote(WatchFilter._meta.db_table),
+                            quote(WatchFilter._meta.get_field('watch').column),
+                            placeholders),
+                           batch)
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)' %
+                           (quote(Watch._meta.db_table),
+                            quote(Watch._meta.pk.column),
+                            placeholders),
+                           batch)
+            deleted += cursor.rowcount
+    for event_type in event_types:
+        _invalidate_recipients(event_type, using=using)
+    return deleted
+
+
+def _invalidate_recipients(event_type=None, using=None):
+    """Invalidate the cached recipient lists of ``event_type``, or of all
+    event types if it's None, now and again once any transaction open on
+    ``using`` commits, so a fire racing the transaction can't cache the
+    recipients it's replacing."""
+    invalidate_recipients(event_type)
+    if connections[using or router.db_for_write(Watch)].in_atomic_block:
+        transaction.on_commit(lambda: invalidate_recipients(event_type),
+                              using=using)
+
+
+def _watch_changed(sender, instance, using, **kwargs):
+    _invalidate_recipients(instance.event_type, using=using)
+
+
+def _watch_filter_changed(sender, instance, using, **kwargs):
+    # Fetching the watch would cost a query per filter, so make do without
+    # its event type if it isn't at hand:
+    _invalidate_recipients(instance.watch.event_type
+                           if instance._watch_is_cached() else None,
+                           using=using)
+
+
+def _remember_email(sender, instance, **kwargs):
+    # Peek at __dict__ so a deferred email isn't fetched:
+    instance.__dict__['_tidings_email'] = instance.__dict__.get(
+        sender.get_email_field_name())
+
+
+def _user_changed(sender, instance, using, created=False, update_fields=None,
+                  **kwargs):
+    # A new user has no watches yet, and only a changed email changes whom
+    # anything is mailed to. (A deleted user's watches go with them.)
+    field = sender.get_email_field_name()
+    email = instance.__dict__.get(field)
+    if (not created and
+            (update_fields is None or field in update_fields) and
+            email != instance.__dict__.get('_tidings_email')):
+        _invalidate_recipients(using=using)
+    instance.__dict__['_tidings_email'] = email
+
+
+def _track_changes(enabled):
+    """Connect the receivers that invalidate cached recipient lists, or
+    disconnect them.
+
+    They're connected only if
+    :data:`~django.conf.settings.TIDINGS_CACHE_RECIPIENTS` is on, since any
+    delete receiver keeps Django from fast-deleting watches and filters.
+
+    """
+    connections_ = [(post_save, _watch_changed, Watch),
+                    (post_delete, _watch_changed, Watch),
+                    (post_save, _watch_filter_changed, WatchFilter),
+                    (post_delete, _watch_filter_changed, WatchFilter),
+                    (post_init, _remember_email, settings.AUTH_USER_MODEL),
+                    (post_save, _user_changed, settings.AUTH_USER_MODEL)]
+    for signal, receiver_, sender in connections_:
+        if enabled:
+            signal.connect(receiver_, sender=sender)
+        else:
+            signal.disconnect(receiver_, sender=sender)
+
+
+_track_changes(recipient_cache_enabled())
+
+
+@receiver(setting_changed)
+def _setting_changed(setting, **kwargs):
+    if setting == 'TIDINGS_CACHE_RECIPIENTS':
+        _track_changes(recipient_cache_enabled())
+
 
 class NotificationsMixin(models.Model):
     """Mixin for notifications models that adds watches as a generic relation.
@@ -0,0 +1,134 @@
+"""A compact, JSON-safe encoding of events for Celery task arguments
+
+Model instances are reduced to a (content type ID, primary key) pair and
+fetched again, in bulk, on the way back out; other objects, such as the events
+themselves, are reduced to their class's import path and their ``__dict__``.
+The result holds only lists, dicts, strings, numbers, booleans, and None, so
+it works with Celery's default JSON serializer.
+
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.utils.module_loading import import_string
+
+from .compat import iteritems, string_types, text_type
+
+
+MODEL = '__model__'
+OBJECT = '__object__'
+DICT = '__dict__'
+SET = '__set__'
+
+
+def encode(value):
+    """Return a JSON-safe encoding of ``value``, undone by :func:`decode()`.
+
+    Tuples come back as lists. Raise TypeError if ``value`` holds something
+    that can't be encoded, like an unsaved model instance or an object whose
+    class isn't importable.
+
+    """
+    if value is None or isinstance(value, (bool, int, float) + string_types):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [encode(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {SET: [encode(v) for v in value]}
+    if isinstance(value, dict):
+        return {DICT: _encode_dict(value)}
+    if isinstance(value, models.Model):
+        if value.pk is None:
+            raise TypeError("Can't encode unsaved instance %r." % value)
+        pk = value.pk if isinstance(value.pk, int) else text_type(value.pk)
+        return {MODEL: [ContentType.objects.get_for_model(value).id, pk]}
+    cls = value.__class__
+    path = '%s.%s' % (cls.__module__, cls.__name__)
+    try:
+        importable = import_string(path) is cls
+    except ImportError:
+        importable = False
+    if not importable or not hasattr(value, '__dict__'):
+        raise TypeError("Can't encode %r." % value)
+    return {OBJECT: [path, _encode_dict(value.__dict__)]}
+
+
+def _encode_dict(d):
+    for key in d:
+        if not isinstance(key, string_types):
+            raise TypeError("Can't encode non-string key %r." % key)
+    return dict((key, encode(v)) for key, v in iteritems(d))
+
+
+def decode(payload):
+    """Rebuild the value :func:`encode()` made ``payload`` from.
+
+    Fetch all the model instances it refers to with one query per model.
+    Raise the model's DoesNotExist if one has since been deleted.
+
+    """
+    pks_by_type = {}
+    _collect_models(payload, pks_by_type)
+    instances = {}
+    for type_id, pks in iteritems(pks_by_type):
+        model = ContentType.objects.get_for_id(type_id).model_class()
+        found = dict((text_type(pk), instance) for pk, instance in
+                     iteritems(model._base_manager.in_bulk(pks)))
+        missing = set(text_type(pk) for pk in pks).difference(found)
+        if missing:
+            raise model.DoesNotExist(
+                '%s with pk %s no longer exists.' %
+                (model.__name__, sorted(missing)[0]))
+        for pk, instance in iteritems(found):
+            instances[type_id, pk] = instance
+    return _rebuild(payload, instances)
+
+
+def _tagged(payload):
+    """Return the tag and contents of an encoded non-JSON value, or (None,
+    None) if ``payload`` is a plain JSON value."""
+    if isinstance(payload, dict) and len(payload) == 1:
+        return next(iteritems(payload))
+    return None, None
+
+
+def _collect_models(payload, pks_by_type):
+    if isinstance(payload, list):
+        for item in payload:
+            _collect_models(item, pks_by_type)
+        return
+    tag, contents = _tagged(payload)
+    if tag == MODEL:
+        type_id, pk = contents
+        pks_by_type.setdefault(type_id, set()).add(pk)
+    elif tag == OBJECT:
+        for item in contents[1].values():
+            _collect_models(item, pks_by_type)
+    elif tag == DICT:
+        for item in contents.values():
+            _collect_models(item, pks_by_type)
+    elif tag == SET:
+        _collect_models(contents, pks_by_type)
+
+
+def _rebuild(payload, instances):
+    if isinstance(payload, list):
+        return [_rebuild(item, instances) for item in payload]
+    tag, contents = _tagged(payload)
+    if tag == MODEL:
+        type_id, pk = contents
+        return instances[type_id, text_type(pk)]
+    if tag == OBJECT:
+        path, state = contents
+        cls = import_string(path)
+        obj = cls.__new__(cls)
+        obj.__dict__.update(_rebuild_dict(state, instances))
+        return obj
+    if tag == DICT:
+        return _rebuild_dict(contents, instances)
+    if tag == SET:
+        return set(_rebuild(item, instances) for item in contents)
+    return payload
+
+
+def _rebuild_dict(d, instances):
+    return dict((key, _rebuild(v, instances)) for key, v in iteritems(d))
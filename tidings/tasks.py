@@ -1,6 +1,26 @@
+from datetime import timedelta
+from smtplib import SMTPException
+import json
+import logging
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, router, transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
 from celery.task import task
 
-from tidings.models import Watch
+from tidings.models import (PendingNotification, Watch, WatchFilter,
+                            delete_watches)
+from tidings.payload import decode
+from tidings.utils import (chunked, invalidate_recipients,
+                           recipient_cache_enabled)
+
+
+log = logging.getLogger('tidings.tasks')
 
 
 @task()
@@ -10,4 +30,171 @@ def claim_watches(user):
     Call this from your user registration process if you like.
 
     """
-    Watch.objects.filter(email=user.email).update(email=None, user=user)
+    watches = Watch.objects.filter(email=user.email)
+    event_types = (set(watches.values_list('event_type', flat=True)
+                       .distinct()) if recipient_cache_enabled() else ())
+    watches.update(email=None, user=user)
+    for event_type in event_types:
+        invalidate_recipients(event_type)
+
+
+@task()
+def claim_watches_bulk(users_or_ids, batch_size=500):
+    """Attach the anonymous watches having each given user's email to that
+    user, and merge any watches that leaves duplicated.
+
+    Use this rather than :func:`claim_watches` to claim for many users at
+    once, as after importing users from elsewhere. Unlike it, emails are
+    matched case-insensitively, and if two users share an email, the one
+    with the lower ID gets the watches. Each batch of ``batch_size`` users
+    takes one UPDATE to claim plus two queries and a DELETE to merge. On
+    PostgreSQL and SQLite, the UPDATE finds its watches through the index on
+    ``lower(email)`` made by migration ``0006``; elsewhere, it scans them.
+
+    When a user ends up with several watches of the same event type, object,
+    and filters, keep the oldest and delete the rest, keeping it active if
+    any of them was.
+
+    Return a dict with the number of watches ``claimed`` and ``merged``
+    away.
+
+    """
+    User = get_user_model()
+    user_table = User._meta.db_table
+    email_column = User._meta.get_field(User.get_email_field_name()).column
+    using = router.db_for_write(Watch)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    claimed = merged = 0
+    for batch in chunked((getattr(u, 'pk', u) for u in users_or_ids),
+                         batch_size):
+        placeholders = ', '.join(['%s'] * len(batch))
+        # A correlated subquery rather than UPDATE ... FROM, which isn't
+        # portable:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {watch} SET {user_id} = ('
+                '  SELECT MIN(u.{id}) FROM {user} u'
+                '  WHERE lower(u.{email}) = lower({watch}.{watch_email})'
+                '    AND u.{id} IN ({ids})),'
+                ' {watch_email} = NULL '
+                'WHERE {user_id} IS NULL AND lower({watch_email}) IN ('
+                '  SELECT lower(u.{email}) FROM {user} u'
+                '  WHERE u.{id} IN ({ids}) AND u.{email} <> %s)'.format(
+                    watch=quote(Watch._meta.db_table),
+                    user_id=quote(Watch._meta.get_field('user').column),
+                    watch_email=quote(Watch._meta.get_field('email').column),
+                    user=quote(user_table),
+                    id=quote(User._meta.pk.column),
+                    email=quote(email_column),
+                    ids=placeholders),
+                batch + batch + [''])
+            claimed += cursor.rowcount
+            merged += _merge_duplicate_watches(batch, using)
+    if claimed:
+        invalidate_recipients()
+    log.info('Claimed %s watches and merged away %s duplicates.',
+             claimed, merged)
+    return {'claimed': claimed, 'merged': merged}
+
+
+def _merge_duplicate_watches(user_ids, using):
+    """Delete all but the oldest of each set of the given users' watches
+    that are alike but for activeness. Return how many were deleted."""
+    filters = {}
+    for watch_id, name, value in (WatchFilter.objects.using(using)
+                                  .filter(watch__user__in=user_ids)
+                                  .values_list('watch_id', 'name', 'value')):
+        filters.setdefault(watch_id, []).append((name, value))
+    kept = {}
+    duplicates, activate = [], set()
+    for watch in (Watch.objects.using(using).filter(user__in=user_ids)
+                  .order_by('pk')):
+        signature = (watch.user_id, watch.event_type, watch.content_type_id,
+                     watch.object_id, frozenset(filters.get(watch.pk, ())))
+        first = kept.setdefault(signature, watch)
+        if first is not watch:
+            duplicates.append(watch.pk)
+            if watch.is_active and not first.is_active:
+                activate.add(first.pk)
+    if activate:
+        Watch.objects.using(using).filter(pk__in=activate).update(
+            is_active=True)
+    return sum(delete_watches(ids, using=using)
+               for ids in chunked(duplicates, 500))
+
+
+@task()
+def send_activation_emails(event_class_path, watch_ids):
+    """Send activation emails for the inactive watches with the given IDs,
+    using the ``_activation_email()`` of the Event subclass at the given
+    dotted path, over one mail connection.
+
+    :meth:`Event.notify_many() <tidings.events.Event.notify_many>` queues
+    this. As :meth:`~tidings.events.Event.notify()` does, delete any watch
+    whose email can't be sent.
+
+    """
+    event_class = import_string(event_class_path)
+    connection = mail.get_connection()
+    try:
+        connection.open()
+        for ids in chunked(watch_ids, 500):
+            for watch in Watch.objects.filter(
+                    pk__in=ids, is_active=False).select_related('user'):
+                email = watch.user.email if watch.user else watch.email
+                message = event_class._activation_email(watch, email)
+                message.connection = connection
+                try:
+                    message.send()
+                except SMTPException as e:
+                    log.warning('Deleting watch %s: activation email to %s '
+                                'failed: %s', watch.pk, email, e)
+                    watch.delete()
+    finally:
+        connection.close()
+
+
+@task()
+def send_digests():
+    """Send the digest of each digest-mode Event subclass whose window has
+    run out.
+
+    A class's window runs out :attr:`~tidings.events.Event.digest_window`
+    seconds after the oldest of its pending fires. Run this periodically,
+    more often than your shortest window--with Celery beat, say--but not
+    concurrently with itself. Fires are forgotten before they are sent, so
+    a crash loses a digest rather than sending it twice, as with ordinary
+    fires.
+
+    """
+    now = timezone.now()
+    oldest_by_class = (PendingNotification.objects.order_by()
+                       .values_list('event_class')
+                       .annotate(oldest=Min('created')))
+    for path, oldest in oldest_by_class:
+        try:
+            event_class = import_string(path)
+        except ImportError:
+            log.warning('Dropping fires of %s, which no longer exists.', path)
+            PendingNotification.objects.filter(event_class=path).delete()
+            continue
+        window = timedelta(seconds=event_class.digest_window or 0)
+        if oldest > now - window:
+            continue
+
+        pending = list(PendingNotification.objects.filter(
+            event_class=path, created__lte=now).order_by('created', 'pk'))
+        for ids in chunked([p.pk for p in pending], 500):
+            PendingNotification.objects.filter(pk__in=ids).delete()
+        events_and_excludes = []
+        for notification in pending:
+            try:
+                event, excluded = decode(json.loads(notification.payload))
+            except ObjectDoesNotExist as exc:
+                log.warning('Dropping a fire of %s: %s', path, exc)
+                continue
+            events_and_excludes.append((event, set(excluded)))
+        sent, failed = event_class._send_digest(events_and_excludes)
+        log.info('Sent a digest of %s fires of %s: %s mails (%s failed).',
+                 len(events_and_excludes), path, sent, failed)
@@ -0,0 +1,47 @@
+from django import template
+
+
+register = template.Library()
+
+#: Context variable holding the list that collects per-recipient blocks while
+#: the shared parts of a template are rendered
+SPLICES = 'tidings_splices'
+
+#: Stands in for each per-recipient block in the shared rendering
+SPLICE_MARKER = u'\x00tidings-splice\x00'
+
+
+class PerRecipientNode(template.Node):
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        splices = context.get(SPLICES)
+        if splices is None:
+            return self.nodelist.render(context)
+        # Remember the block, what it could see, and how it was to be
+        # rendered (say, under {% autoescape off %}), to render once per
+        # recipient later:
+        flattened = context.flatten()
+        del flattened[SPLICES]
+        options = {'autoescape': context.autoescape,
+                   'use_l10n': context.use_l10n,
+                   'use_tz': context.use_tz}
+        splices.append((self.nodelist, flattened, options))
+        return SPLICE_MARKER
+
+
+@register.tag
+def per_recipient(parser, token):
+    """Mark the part of an email template that differs between recipients.
+
+    Everything outside ``{% per_recipient %}...{% endper_recipient %}`` blocks
+    must be the same for everyone, so
+    :func:`~tidings.utils.emails_with_users_and_watches` can render it once
+    per fire when passed ``splice=True``. Otherwise, the tag just renders its
+    contents.
+
+    """
+    nodelist = parser.parse(('endper_recipient',))
+    parser.delete_first_token()
+    return PerRecipientNode(nodelist)
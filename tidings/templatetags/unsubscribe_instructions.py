@@ -1,10 +1,18 @@
 from django import template
 
+from tidings.models import URL_BUILDER, URLBuilder
+
 
 register = template.Library()
 
 
-@register.inclusion_tag('tidings/email/unsubscribe.ltxt')
-def unsubscribe_instructions(watch):
-    """Return instructions and link for unsubscribing from the given watch."""
-    return {'watch': watch}
+@register.inclusion_tag('tidings/email/unsubscribe.ltxt', takes_context=True)
+def unsubscribe_instructions(context, watch):
+    """Return instructions and link for unsubscribing from the given watch.
+
+    Build the link with the :class:`~tidings.models.URLBuilder` of the fire
+    being rendered, if there is one in the context.
+
+    """
+    urls = context.get(URL_BUILDER) or URLBuilder()
+    return {'watch': watch, 'unsubscribe_url': urls.unsubscribe_url(watch)}
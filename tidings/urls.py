@@ -1,10 +1,13 @@
 from django.conf.urls import url
 
-from .views import unsubscribe
+from .views import one_click_unsubscribe, unsubscribe
 
 
 urlpatterns = (
     url(r'^unsubscribe/(?P<watch_id>\d+)$',
         unsubscribe,
         name='tidings.unsubscribe'),
+    url(r'^unsubscribe/one-click/(?P<token>[^/]+)$',
+        one_click_unsubscribe,
+        name='tidings.one_click_unsubscribe'),
 )
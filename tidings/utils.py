@@ -1,13 +1,20 @@
+from collections import deque
+from hashlib import md5
+from uuid import uuid4
+from heapq import heapify, heappop, heapreplace
 from zlib import crc32
 
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
 from django.core.mail import EmailMessage
 from django.template import Context, loader
 from django.urls import reverse as django_reverse
 from django.utils.module_loading import import_string
 
-from .compat import next, string_types
+from .compat import (heapify_max, heappop_max, heapreplace_max, next,
+                     string_types, text_type)
+from .templatetags.per_recipient import SPLICE_MARKER, SPLICES
 
 
 def collate(*iterables, **kwargs):
@@ -17,33 +24,52 @@ def collate(*iterables, **kwargs):
     If ``reverse=True`` is passed, iterables must return their results in
     descending order rather than ascending.
 
+    Items with equal keys come out in the order of their iterables: first to
+    last, or last to first if ``reverse=True``. Merging k iterables keeps a
+    heap of k items, so each item costs O(log k) comparisons and a single
+    ``key`` call.
+
     """
     key = kwargs.pop('key', lambda a: a)
     reverse = kwargs.pop('reverse', False)
-    min_or_max = max if reverse else min
+    if reverse:
+        # On a max-heap, the bigger index wins ties.
+        heapify_, heappop_, heapreplace_ = (heapify_max, heappop_max,
+                                            heapreplace_max)
+    else:
+        heapify_, heappop_, heapreplace_ = heapify, heappop, heapreplace
 
-    rows = [iter(iterable) for iterable in iterables if iterable]
-    next_values = {}
-    by_key = []
+    # Each entry is (key, index of iterable, item, iterator). No two entries
+    # share an index, so items and iterators are never compared.
+    heap = []
+    for index, iterable in enumerate(it for it in iterables if it):
+        row = iter(iterable)
+        for value in row:
+            heap.append((key(value), index, value, row))
+            break
+    heapify_(heap)
 
-    def gather_next_value(row, index):
+    while heap:
+        _, index, value, row = heap[0]
+        yield value
         try:
             next_value = next(row)
         except StopIteration:
-            pass
+            heappop_(heap)
         else:
-            next_values[index] = next_value
-            by_key.append((key(next_value), index))
+            heapreplace_(heap, (key(next_value), index, next_value, row))
 
-    for index, row in enumerate(rows):
-        gather_next_value(row, index)
 
-    while by_key:
-        key_value, index = min_or_max(by_key)
-        by_key.remove((key_value, index))
-        next_value = next_values.pop(index)
-        yield next_value
-        gather_next_value(rows[index], index)
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` consecutive items from ``iterable``."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 def hash_to_unsigned(data):
@@ -78,7 +104,9 @@ def hash_to_unsigned(data):
 
 def emails_with_users_and_watches(
         subject, template_path, vars, users_and_watches,
-        from_email=settings.TIDINGS_FROM_ADDRESS, **extra_kwargs):
+        from_email=settings.TIDINGS_FROM_ADDRESS, splice=False,
+        processes=None, chunk_size=None, list_unsubscribe=False,
+        **extra_kwargs):
     """Return iterable of EmailMessages with user and watch values substituted.
 
     A convenience function for generating emails by repeatedly rendering a
@@ -86,25 +114,170 @@ def emails_with_users_and_watches(
     for each pair in ``users_and_watches``
 
     :arg template_path: path to template file
-    :arg vars: a map which becomes the Context passed in to the template
+    :arg vars: a map which becomes the Context passed in to the template,
+      along with a :class:`~tidings.models.URLBuilder` as ``tidings_urls``,
+      which ``{% unsubscribe_instructions %}`` uses and templates may too
+    :arg splice: If True, render the template only once, without ``user``,
+      ``watch``, and ``watches``, and then render just its ``{% per_recipient
+      %}`` blocks for each recipient and splice them in. This saves
+      re-rendering the parts of a big mail that are the same for everybody.
+      The template must be a Django one, and anything in it that depends on
+      the recipient must be inside a ``{% per_recipient %}`` block.
+    :arg processes: If more than 0, render in a pool of this many processes,
+      for CPU-heavy templates. Defaults to
+      :data:`~django.conf.settings.TIDINGS_RENDER_PROCESSES`. ``vars`` and the
+      users and watches must then be pickleable.
+    :arg chunk_size: How many recipients to hand a rendering process at a
+      time. Defaults to
+      :data:`~django.conf.settings.TIDINGS_RENDER_CHUNK_SIZE`.
+    :arg list_unsubscribe: If True, add :rfc:`8058` ``List-Unsubscribe`` and
+      ``List-Unsubscribe-Post`` headers to each mail, offering one-click
+      deletion of the recipient's watches. This needs ``tidings.urls``
+      included in your URLconf.
     :arg extra_kwargs: additional kwargs to pass into EmailMessage constructor
 
     """
+    if processes is None:
+        processes = getattr(settings, 'TIDINGS_RENDER_PROCESSES', 0)
+    if processes > 0:
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'TIDINGS_RENDER_CHUNK_SIZE', 100)
+        for mail in _render_in_processes(
+                processes, chunk_size, users_and_watches,
+                (subject, template_path, vars, from_email, splice,
+                 list_unsubscribe, extra_kwargs)):
+            yield mail
+        return
+
+    from .models import URL_BUILDER, URLBuilder
+
+    # One set of site and URL lookups for the whole fire:
+    urls = URLBuilder()
+    vars = dict(vars, **{URL_BUILDER: urls})
     template = loader.get_template(template_path)
-    context = Context(vars)
-    for u, w in users_and_watches:
-        context['user'] = u
+    if splice:
+        render = _spliced_renderer(template, vars)
+    else:
+        def render(recipient_vars):
+            return template.render(dict(vars, **recipient_vars))
 
+    for u, w in users_and_watches:
         # Arbitrary single watch for compatibility with 0.1
         # TODO: remove.
-        context['watch'] = w[0]
-
-        context['watches'] = w
+        body = render({'user': u, 'watch': w[0], 'watches': w})
+        kwargs = extra_kwargs
+        if list_unsubscribe:
+            kwargs = dict(extra_kwargs, headers=dict(
+                extra_kwargs.get('headers') or {},
+                **urls.list_unsubscribe_headers(watches=w)))
         yield EmailMessage(subject,
-                           template.render(context),
+                           body,
                            from_email,
                            [u.email],
-                           **extra_kwargs)
+                           **kwargs)
+
+
+def _spliced_renderer(template, vars):
+    """Render ``template`` once with ``vars``, and return a function that
+    renders only its per-recipient blocks for a given recipient's context and
+    splices them into that."""
+    splices = []
+    shared_parts = template.render(
+        dict(vars, **{SPLICES: splices})).split(SPLICE_MARKER)
+    template = template.template  # Get at the Django Template inside.
+
+    def render(recipient_vars):
+        pieces = [shared_parts[0]]
+        for splice, shared in zip(splices, shared_parts[1:]):
+            nodelist, flattened, options = splice
+            context = Context(flattened, **options)
+            context.update(recipient_vars)
+            with context.bind_template(template):
+                pieces.append(nodelist.render(context))
+            pieces.append(shared)
+        return u''.join(pieces)
+    return render
+
+
+# Process pools for rendering, by size
+_render_pools = {}
+
+
+def _render_pool(processes):
+    """Return a shared ProcessPoolExecutor of ``processes`` processes."""
+    try:
+        pool = _render_pools[processes]
+    except KeyError:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:
+            raise ImproperlyConfigured(
+                'Rendering in processes needs concurrent.futures. On Python '
+                '2, install the "futures" package.')
+        pool = _render_pools[processes] = ProcessPoolExecutor(processes)
+    return pool
+
+
+# Whether this is a rendering process that _init_render_process() has run in
+_render_process_ready = False
+
+
+def _init_render_process():
+    """Make a new rendering process ready to use Django, unless that's
+    already done.
+
+    It's called from each task rather than as the pool's ``initializer``,
+    which needs Python 3.7.
+
+    """
+    global _render_process_ready
+    if _render_process_ready:
+        return
+    _render_process_ready = True
+
+    from django import setup
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        # We were spawned rather than forked.
+        setup()
+    # A forked process shares its parent's DB sockets. Drop them unclosed,
+    # so any queries made while rendering open their own.
+    for connection in connections.all():
+        connection.connection = None
+
+
+def _render_chunk(args, users_and_watches):
+    """Render the mails for one chunk of recipients in a rendering
+    process."""
+    _init_render_process()
+    (subject, template_path, vars, from_email, splice, list_unsubscribe,
+     extra_kwargs) = args
+    return list(emails_with_users_and_watches(
+        subject, template_path, vars, users_and_watches,
+        from_email=from_email, splice=splice, processes=0,
+        list_unsubscribe=list_unsubscribe, **extra_kwargs))
+
+
+def _render_in_processes(processes, chunk_size, users_and_watches, args):
+    """Yield the mails for ``users_and_watches``, in order, rendered in
+    chunks by a pool of ``processes`` processes.
+
+    Only a couple of chunks per process are in flight at once, so recipients
+    are still consumed lazily.
+
+    """
+    pool = _render_pool(processes)
+    in_flight = deque()
+    for chunk in chunked(users_and_watches, chunk_size):
+        in_flight.append(pool.submit(_render_chunk, args, chunk))
+        if len(in_flight) >= processes * 2:
+            for mail in in_flight.popleft().result():
+                yield mail
+    while in_flight:
+        for mail in in_flight.popleft().result():
+            yield mail
 
 
 def import_from_setting(setting_name, fallback):
@@ -127,5 +300,56 @@ def import_from_setting(setting_name, fallback):
         return fallback
 
 
+def tidings_cache():
+    """Return the cache named by
+    :data:`~django.conf.settings.TIDINGS_CACHE`."""
+    return caches[getattr(settings, 'TIDINGS_CACHE', 'default')]
+
+
+def cache_key(*parts):
+    """Return a key for :func:`tidings_cache()` made from ``parts``, short
+    and plain enough for any cache backend."""
+    return 'tidings:%s' % md5(
+        ':'.join(text_type(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def recipient_cache_enabled():
+    """Return whether :data:`~django.conf.settings.TIDINGS_CACHE_RECIPIENTS`
+    is on, so changes to watches are tracked for cached recipient lists."""
+    return getattr(settings, 'TIDINGS_CACHE_RECIPIENTS', False)
+
+
+def recipient_generation(event_type):
+    """Return a token that changes whenever the watches of ``event_type``
+    might have, for keying cached recipient lists
+
+    It combines a generation for ``event_type`` with one for all event types,
+    each bumped by :func:`invalidate_recipients()`. A generation evicted from
+    the cache is replaced by a new one, never reset, so entries keyed by the
+    old one can't come back to life.
+
+    """
+    cache = tidings_cache()
+    keys = [cache_key('recipient generation'),
+            cache_key('recipient generation', event_type)]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, uuid4().hex, None)
+            generations[key] = cache.get(key)
+    return '%s.%s' % tuple(generations.get(key) for key in keys)
+
+
+def invalidate_recipients(event_type=None):
+    """Retire every cached recipient list of ``event_type``, or of all event
+    types if it's None. Do nothing unless :func:`recipient_cache_enabled()`.
+    See :attr:`tidings.events.Event.recipient_cache_timeout`."""
+    if not recipient_cache_enabled():
+        return
+    parts = ('recipient generation',) if event_type is None else (
+        'recipient generation', event_type)
+    tidings_cache().set(cache_key(*parts), uuid4().hex, None)
+
+
 # Here to be imported by others:
 reverse = import_from_setting('TIDINGS_REVERSE', django_reverse)  # no QA
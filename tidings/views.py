@@ -1,7 +1,12 @@
 from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from tidings.models import Watch
+from tidings.models import UNSUBSCRIBE_SALT, Watch, delete_watches
 
 
 def unsubscribe(request, watch_id):
@@ -42,3 +47,35 @@ def unsubscribe(request, watch_id):
         return render(request, 'tidings/unsubscribe_success.' + ext)
 
     return render(request, 'tidings/unsubscribe.' + ext)
+
+
+@csrf_exempt
+@require_POST
+def one_click_unsubscribe(request, token):
+    """Delete the watches named by a signed ``token``, as made by
+    :func:`~tidings.models.one_click_unsubscribe_url`, and return an empty
+    200 response.
+
+    This is the target of the ``List-Unsubscribe`` header of :rfc:`8058`,
+    which mailbox providers POST to, often in bursts after a big fire, so it
+    is kept cheap: the token is checked by its signature alone, no template
+    is rendered, and deleting a token's watches takes one transaction. A
+    token may instead name an email address, in which case every watch of
+    that address--anonymous or belonging to a user having it--is deleted.
+
+    Return a 400 if the token is bad. Watches that are already gone are no
+    error.
+
+    """
+    try:
+        target = signing.loads(token, salt=UNSUBSCRIBE_SALT)
+    except signing.BadSignature:
+        return HttpResponseBadRequest()
+    if isinstance(target, list):
+        ids = [int(pk) for pk in target]
+    else:
+        ids = list(Watch.objects.filter(
+            Q(email__iexact=target) | Q(user__email__iexact=target))
+            .values_list('id', flat=True))
+    delete_watches(ids)
+    return HttpResponse()